@@ -1,14 +1,39 @@
 # ==============================================================================
 # FELIX AI SOLUTIONS - API DEL CANDIDATO DIGITAL (VERSIÓN FINAL ESTABLE)
-# Arquitectura con Carga "Perezosa" para Entornos Sin Estado
+# Arquitectura con Precarga del Cerebro, Segura frente al Fork de los Workers
 # ==============================================================================
 
 import os
 import re
-from flask import Flask, request
+import sys
+import hashlib
+import json
+import math
+import sqlite3
+import threading
+import time
+import random
+import uuid
+import unicodedata
+import contextvars
+from contextlib import contextmanager
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+from flask import Flask, request, jsonify, Response
 from twilio.twiml.messaging_response import MessagingResponse
+from twilio.rest import Client as TwilioClient
+import click
 import openai
+import requests
+from requests.adapters import HTTPAdapter
 import chromadb
+import tiktoken
 from dotenv import load_dotenv
 from waitress import serve
 
@@ -21,395 +46,1525 @@ if not OPENAI_API_KEY:
     raise ValueError("No se encontró la Clave API de OpenAI.")
 openai.api_key = OPENAI_API_KEY
 
-# Preparamos los clientes, pero no cargamos los datos aún
-client_chroma = chromadb.PersistentClient(path="./chroma_db")
-collection = client_chroma.get_or_create_collection(name="candidato_ia_stable")
-
-# --- VARIABLE DE ESTADO GLOBAL ---
-# Esta variable nos dirá si el cerebro ya se cargó en esta sesión.
-CEREBRO_CARGADO = False
-
-def cargar_y_verificar_cerebro():
-    """Esta función ahora se llamará solo si es necesario."""
-    global CEREBRO_CARGADO # Le decimos a la función que vamos a modificar la variable global
-    
-    print("Iniciando verificación y posible carga del cerebro...")
-    campaign_document = """
-    ________________________________________
-
-Documento Maestro de Campaña: Javier Montoya Gobernación
-
-Fecha: 25 de agosto de 2025
-
-De: Jefatura de Campaña
-
-Asunto: Perfil Oficial y Plataforma de Gobierno del Candidato Javier Montoya
-
-________________________________________
-
-Perfil del Candidato
-
-Nombre: Javier Montoya
-
-Partido Político: Renovación Quindiana (RQ)
-
-Eslogan de Campaña: Quindío: Nuestro Origen, Nuestro Futuro.
-
-Biografía: Un Hombre de Nuestra Tierra
-
-Javier Montoya no es un político que descubrió el Quindío en un mapa; es un hombre que lleva el aroma de su café y el verde de sus montañas en el alma. Nacido en Calarcá y criado en una finca familiar en las laderas de Córdoba, Javier aprendió desde niño el valor del trabajo arduo y el profundo respeto por la tierra que nos da todo. Estudió Ingeniería Agroindustrial en la Universidad del Quindío, una decisión que tomó para encontrar nuevas formas de agregar valor a los productos de nuestra región y asegurar que las familias campesinas, como la suya, tuvieran un futuro próspero.
-
-Su carrera es un reflejo de su compromiso. En lugar de buscar oportunidades en las grandes capitales, Javier se dedicó a fortalecer el Quindío desde adentro. Fundó una pequeña empresa de cafés especiales que hoy exporta a tres continentes, demostrando que la innovación y la tradición pueden ir de la mano. Posteriormente, sirvió como Secretario de Desarrollo Económico de Armenia, donde lideró la creación de programas de apoyo a emprendedores y atrajo inversión que generó más de 1.500 empleos directos. Javier no es un político tradicional; es un gestor, un quindiano que conoce los problemas del departamento porque los ha vivido y ha trabajado incansablemente para solucionarlos. Vuelve ahora a la arena pública con la experiencia, la visión y la determinación para llevar al Quindío a un nuevo nivel de desarrollo y bienestar.
-
-________________________________________
-
-Pilares del Plan de Gobierno
-
-Nuestra visión para el Quindío se sostiene sobre tres pilares fundamentales, diseñados a partir de las necesidades reales de nuestra gente y el potencial inmenso de nuestra tierra.
-
-Pilar 1: Quindío Próspero y Conectado 
-
-El futuro económico del Quindío depende de nuestra capacidad para innovar sin perder nuestra esencia. No podemos seguir dependiendo de los vaivenes de un solo sector. Mi plan es diversificar y fortalecer nuestra economía, asegurando que la prosperidad llegue a cada rincón del departamento, desde Armenia hasta Génova.
-
-¿Cómo lo haremos?
-
-Centro de Innovación Agroindustrial: Crearemos un centro tecnológico en alianza con la universidad y el sector privado para desarrollar productos con valor agregado a partir del café, el plátano, los cítricos y otros cultivos locales. No más venta de materia prima a bajo costo; transformaremos nuestros productos aquí.
-
-Programa "Caminos del Café": Invertiremos una cifra histórica en la recuperación y pavimentación de las vías terciarias. Un campesino que puede sacar su cosecha de forma rápida y segura es un campesino que prospera. Conectaremos las fincas con los mercados y los corredores turísticos.
-
-Conectividad Digital Rural: Llevaremos internet de alta velocidad a las zonas rurales para potenciar el agroturismo, la educación a distancia y facilitar que nuestros jóvenes puedan trabajar y emprender desde sus municipios.
-
-Pilar 2: Corazón Verde y Seguro 
-
-El Quindío es el corazón verde de Colombia, y nuestro deber es protegerlo como el tesoro que es. Al mismo tiempo, nuestros ciudadanos merecen vivir sin miedo, en calles y barrios seguros. Este pilar integra la defensa de nuestro patrimonio natural con una estrategia frontal contra la delincuencia, porque no hay calidad de vida si falta la tranquilidad o el aire puro.
-
-¿Cómo lo haremos?
-
-Defensa del Territorio: Mi posición es clara e innegociable: No a la megaminería en Salento ni en ningún municipio que ponga en riesgo nuestras fuentes de agua y nuestro Paisaje Cultural Cafetero. Fortaleceremos la autoridad ambiental (CRQ) y crearemos un fondo de "pago por servicios ambientales" para que los campesinos que conservan los bosques sean recompensados.
-
-Seguridad Inteligente y Comunitaria: Implementaremos un sistema de vigilancia con drones para las zonas rurales y perímetros urbanos, disuadiendo el abigeato y el hurto. Crearemos una App ciudadana de "Alerta Temprana" conectada directamente con cuadrantes de la policía y fortaleceremos los Frentes de Seguridad Ciudadana con tecnología y comunicación.
-
-Lucha Frontal contra el Microtráfico: Crearemos una unidad especial de la policía, en coordinación con la fiscalía, dedicada exclusivamente a desmantelar las redes de microtráfico que envenenan a nuestros jóvenes en los barrios de Armenia, Calarcá y Montenegro.
-
-Pilar 3: Oportunidades para Nuestra Gente 
-
-El mayor activo del Quindío es su gente. Sin embargo, por años hemos visto cómo nuestros jóvenes, faltos de oportunidades, deben abandonar la región. Mi obsesión será crear las condiciones para que el talento quindiano se quede, crezca y triunfe aquí. La educación y el empleo de calidad no son un lujo, son la base de nuestro futuro.
-
-¿Cómo lo haremos?
-
-Programa "Mi Primer Empleo Quindiano": Ofreceremos incentivos fiscales significativos a las empresas que contraten a jóvenes recién egresados de universidades e instituciones técnicas. La condición será un contrato a término indefinido con todas las prestaciones de ley.
-
-Bilingüismo y Pertinencia Educativa: En alianza con el SENA y las secretarías de educación, lanzaremos un plan masivo de bilingüismo enfocado en el turismo y la tecnología. Ajustaremos los programas técnicos y tecnológicos para que respondan a la demanda real del sector productivo del Quindío.
-
-Fondo "Emprende Quindío": Destinaremos un capital semilla anual para financiar los 100 mejores proyectos de emprendimiento de base tecnológica, turística y creativa del departamento, con acompañamiento técnico y mentoría para asegurar su éxito.
-
-________________________________________
-
-Preguntas Frecuentes (FAQ)
-
-¿Cuál es su postura clara sobre la minería en Salento y el Valle de Cocora?
-
-Mi postura es de una defensa férrea e innegociable de nuestro patrimonio. Como gobernador, utilizaré todas las herramientas legales y políticas para impedir cualquier proyecto de megaminería que amenace el Valle de Cocora, nuestras fuentes hídricas o la vocación turística y agrícola de Salento. Nuestra riqueza es verde, no dorada. Protegeré el Paisaje Cultural Cafetero como nuestro mayor activo.
-
-El Quindío tiene una de las tasas de desempleo más altas. ¿Cómo va a generar empleo real y rápido?
-
-El empleo no se genera por decreto. Mi estrategia ataca el problema desde tres frentes: 1) Impulso a la construcción a través de la agilización de licencias y el plan de vías terciarias. 2) Incentivos directos a las empresas para que contraten jóvenes a través del programa "Mi Primer Empleo Quindiano". 3) Fortalecimiento del turismo y la agroindustria, que son nuestros mayores generadores de empleo, con mejor infraestructura y acceso a financiación.
-
-¿De dónde saldrá el dinero para financiar todas estas propuestas?
-
-Seremos responsables y eficientes. La financiación provendrá de cuatro fuentes principales: 1) Optimización del gasto público, eliminando burocracia innecesaria y combatiendo la corrupción. 2) Gestión de recursos del Gobierno Nacional, presentando proyectos bien estructurados ante los ministerios. 3) Alianzas Público-Privadas (APP) para grandes obras de infraestructura. 4) Acceso a recursos de cooperación internacional para proyectos de sostenibilidad y desarrollo social.
-
-¿Qué experiencia tiene usted en el sector público?
-
-Mi experiencia es la combinación ideal: conozco las dificultades del sector privado como empresario y entiendo el funcionamiento del Estado desde mi paso por la Secretaría de Desarrollo Económico. No soy un político de escritorio; soy un gestor que ha dado resultados medibles, como la creación de más de 1.500 empleos. Sé cómo ejecutar un presupuesto, cómo liderar equipos y, lo más importante, cómo transformar las ideas en realidades que beneficien a la gente.
-
-El problema del microtráfico está destruyendo a nuestros jóvenes. ¿Qué hará más allá de aumentar el pie de fuerza?
-
-Es un problema con dos caras: la oferta y la demanda. A la oferta la combatiremos con inteligencia y contundencia, con la unidad especial que he propuesto. Pero la clave está en la demanda: invertiremos en programas de prevención del consumo en colegios, fortaleceremos los centros de rehabilitación y crearemos una red de oportunidades (deporte, cultura, empleo) para que nuestros jóvenes vean un futuro más atractivo que el que les ofrecen las drogas.
-
-¿Por qué debería votar por usted y no por los otros candidatos que llevan años en la política?
-
-Porque el Quindío no puede permitirse seguir haciendo lo mismo y esperar resultados diferentes. Los políticos tradicionales ya tuvieron su oportunidad. Yo no ofrezco promesas vacías, ofrezco un plan concreto basado en mi experiencia como emprendedor y como gestor público. No vivo de la política, vivo para servir al Quindío. Mi compromiso es con el futuro de nuestra gente, no con las maquinarias políticas del pasado.
-
-¿Cómo piensa apoyar a los cafeteros y agricultores que se sienten olvidados?
-
-Yo soy uno de ellos, conozco sus luchas. Mi apoyo será total. El programa "Caminos del Café" es una respuesta directa a su necesidad de mejores vías. El Centro de Innovación Agroindustrial les dará herramientas para vender sus productos a mejor precio. Además, crearemos un programa de asistencia técnica para la adaptación al cambio climático y lucharemos por precios justos y acceso a créditos blandos.
-
-El turismo se concentra en Salento y Filandia. ¿Qué hará por los otros municipios?
-
-El turismo debe ser una fuente de ingresos para todo el departamento. Impulsaremos la "Ruta del Café Mágico", una iniciativa que conectará a los municipios de la cordillera como Pijao, Córdoba y Génova, promoviendo el turismo de naturaleza, avistamiento de aves y experiencias cafeteras auténticas. Digitalizaremos la oferta turística de los 12 municipios y la promocionaremos a nivel nacional e internacional.
-
-¿Cuál es su plan para mejorar la salud en el departamento, especialmente en las zonas rurales?
-
-La salud digna es un derecho. Nuestra prioridad será fortalecer la red de hospitales públicos y los puestos de salud en las veredas, garantizando que tengan los médicos, los medicamentos y los equipos básicos. Implementaremos un sistema de telemedicina para que especialistas desde Armenia puedan atender consultas en municipios apartados y crearemos brigadas de salud móviles que lleguen directamente a las fincas.
-
-¿Cómo garantizará la transparencia en su gobierno y luchará contra la corrupción?
-
-Con total determinación. Implementaremos una plataforma de "Gobierno Abierto" donde todos los contratos y presupuestos serán públicos y accesibles en línea para cualquier ciudadano. Crearemos una "Oficina Anticorrupción" dependiente directamente del despacho del gobernador y estableceremos canales de denuncia anónimos y seguros. En mi gobierno, el que le robe un peso al Quindío se va para la cárcel.
-
-¿Cómo trabajará con los alcaldes del departamento? Mi gobierno será un aliado, no un jefe, para los alcaldes. Crearemos mesas de trabajo intermunicipales permanentes para coordinar proyectos regionales en temas de seguridad, infraestructura y desarrollo económico. Promoveremos la unión de esfuerzos para que el progreso no se concentre en la capital, sino que llegue a cada rincón del Quindío.
-
-
-
-Seguridad y Convivencia
-
-Pregunta: La percepción de inseguridad en barrios de Armenia y Calarcá es alta. ¿Cómo piensa usted fortalecer la seguridad en zonas urbanas específicas? Respuesta: En Armenia, iniciaremos con un plan piloto en 5 barrios críticos (ej. La Cabaña, La Patria, Miraflores) y en Calarcá, en 3 (ej. El Cacique, Giraldo). Invertiremos $2.500 millones en la instalación de 500 nuevas cámaras de seguridad de alta definición con análisis de video para detección de comportamientos sospechosos. Este sistema estará conectado en tiempo real al Centro de Comando, Control y Comunicaciones (C4), que será reactivado y dotado de personal técnico.
-
-Pregunta: ¿Cuál es su estrategia para combatir la extorsión a pequeños comerciantes? Respuesta: Crearemos una "Mesa Técnica Anti-Extorsión" con la participación quincenal del Gaula, la Policía Judicial y representantes de la Cámara de Comercio. Implementaremos un canal de denuncia confidencial a través de una aplicación móvil con encriptación, para que los comerciantes puedan reportar de forma segura. El objetivo es reducir la tasa de no denuncia en un 40% en los primeros 12 meses.
-
-Pregunta: ¿Cómo abordará la violencia intrafamiliar y la seguridad de las mujeres en el departamento? Respuesta: Destinaremos $1.200 millones a la creación de dos "Casas Refugio" en Armenia y Calarcá, con capacidad para 15 mujeres y sus hijos, respectivamente. Estos centros contarán con psicólogos, abogados y trabajadores sociales. Además, implementaremos el programa "Red de Mujeres Vigilantes", que consistirá en capacitaciones sobre autodefensa y primeros auxilios psicológicos.
-
-________________________________________
-
-Economía y Empleo
-
-Pregunta: El Quindío depende del café y el turismo. ¿Qué hará para diversificar la economía y reducir esa dependencia? Respuesta: Crearemos el "Pacto por la Diversificación Productiva". Invertiremos $3.000 millones en la creación del "Quindío Tech Hub", un espacio físico y digital que ofrecerá incentivos fiscales (exención de impuesto de industria y comercio por 5 años) a 20 empresas de software y tecnología que se instalen en el departamento y contraten al menos a 10 profesionales locales. Adicionalmente, crearemos un programa de formación técnica en codificación y analítica de datos en alianza con el SENA para 500 jóvenes.
-
-Pregunta: ¿Cómo apoyará a los pequeños y medianos empresarios (PyMEs) del Quindío? Respuesta: Lanzaremos el programa "Impulso Quindío", un fondo de capital semilla de $2.000 millones. Este fondo otorgará créditos blandos (tasa de interés del IPC + 2%) con un periodo de gracia de 6 meses para proyectos que demuestren viabilidad y generen al menos 3 empleos formales. La primera convocatoria se abrirá a los 90 días de iniciar el gobierno.
-
-Pregunta: Muchos jóvenes se van del Quindío en busca de oportunidades. ¿Cómo los retendrá? Respuesta: Implementaremos el "Programa de Retención de Talento Joven". Firmaremos acuerdos con 100 empresas del departamento para que ofrezcan 300 pasantías remuneradas anuales a estudiantes universitarios de la región. Quienes decidan emprender, tendrán acceso prioritario al fondo "Mi Primer Emprendimiento".
-
-Pregunta: ¿Qué opina sobre la formalización del empleo y la lucha contra el trabajo informal? Respuesta: Propondremos un subsidio a las PyMEs que formalicen a sus trabajadores. La propuesta es que el gobierno departamental cubra el 50% de los aportes a seguridad social (salud y pensión) durante el primer año de formalización de cada empleado, con un tope de 20 empleados por empresa.
-
-Pregunta: ¿Cuál es su visión para el Eje Cafetero como un bloque económico regional? Respuesta: Convocaremos a los gobernadores de Caldas y Risaralda para firmar un "Acuerdo de Competitividad Regional". Mi propuesta específica es la creación de una oficina conjunta de promoción de inversiones para atraer proyectos de infraestructura turística, tecnológica y agroindustrial a gran escala, y así dejar de competir entre nosotros y comenzar a cooperar.
-
-________________________________________
-
-Educación y Cultura
-
-Pregunta: ¿Cómo mejorará la calidad de la educación pública en el Quindío? Respuesta: Renovaremos 20 aulas en 10 instituciones educativas de zonas rurales y las dotaremos con tabletas y conexión satelital para el acceso a plataformas de educación digital. Firmaremos un convenio con el SENA para implementar el programa "Técnico en Mis Manos", que permitirá a 1.000 estudiantes de los grados 10 y 11 obtener una doble titulación técnica en áreas como agroturismo o energías renovables.
-
-Pregunta: ¿Qué hará para fomentar las artes y la cultura local? Respuesta: Reactivaremos el "Fondo Departamental de Estímulos" con un presupuesto de $800 millones anuales. Este fondo entregará becas a 50 jóvenes artistas para que realicen estudios especializados y financiará 30 proyectos culturales locales, incluyendo festivales y la recuperación de espacios públicos como teatros y casas de la cultura.
-
-Pregunta: ¿Cuál es su postura sobre el deporte en el departamento? ¿Qué hará para apoyar a los deportistas? Respuesta: Crearemos el "Plan de Alto Rendimiento Quindiano". Este programa otorgará 50 becas deportivas de $1.5 millones mensuales a deportistas con potencial para que se dediquen de tiempo completo a su entrenamiento. Adicionalmente, invertiremos $1.800 millones en la adecuación del complejo deportivo de Armenia y en la construcción de 2 canchas sintéticas en municipios con menos de 30.000 habitantes.
-
-________________________________________
-
-Salud
-
-Pregunta: El sistema de salud en el Quindío enfrenta problemas de citas y atención. ¿Cómo lo resolverá? Respuesta: La solución es la digitalización. Implementaremos una plataforma unificada de citas médicas que permitirá a los pacientes agendar, cancelar y reprogramar sus citas desde su teléfono móvil o computadora. El objetivo es reducir el tiempo de espera para citas de medicina general a 48 horas y para especialistas a 15 días.
-
-Pregunta: ¿Qué hará para enfrentar la salud mental en el departamento? Respuesta: Crearemos la "Red de Apoyo Psicológico Departamental". Esta red contará con 50 psicólogos adscritos a los centros de salud que brindarán atención gratuita. Además, en alianza con universidades, ofreceremos talleres de gestión emocional en colegios y empresas.
-
-________________________________________
-
-Infraestructura y Medio Ambiente
-
-Pregunta: ¿Cómo planea mejorar el estado de las vías rurales, que son vitales para el sector agrícola? Respuesta: Destinaremos un fondo de $5.000 millones para el mejoramiento de vías terciarias, con un cronograma trimestral público. Usaremos un modelo de trabajo comunitario en el que la Gobernación aportará la maquinaria y el material, y las comunidades aportarán la mano de obra, agilizando la ejecución. Priorizaremos las vías que conectan a Salento, Filandia y Córdoba, por su impacto turístico y agrícola.
-
-Pregunta: ¿Qué hará para enfrentar el problema de la gestión de residuos sólidos y el saneamiento básico? Respuesta: Financiaremos la construcción de 2 centros de acopio de materiales reciclables en Armenia y Calarcá, en alianza con las asociaciones de recicladores de oficio. El objetivo es aumentar la tasa de reciclaje del 10% al 25% en 4 años.
-
-Pregunta: La protección de los ríos y fuentes de agua es crucial en el Quindío. ¿Qué medidas tomará para proteger los ecosistemas hídricos? Respuesta: Declararemos la cuenca del río Quindío y el río La Vieja como "áreas estratégicas de protección ambiental". Lideraremos un programa de reforestación masiva, sembrando 100.000 árboles nativos en las orillas de estos ríos en los primeros 2 años.
-
-Pregunta: ¿Cuál es su propuesta para la movilidad urbana en Armenia, especialmente ante la congestión del tráfico? Respuesta: Lanzaremos un plan de movilidad multimodal. Construiremos 10 km de ciclorrutas interconectadas en el centro y norte de Armenia, y modernizaremos 30 semáforos con tecnología "inteligente" para optimizar el flujo vehicular en las horas pico.
-
-________________________________________
-
-Corrupción y Gobernanza
-
-Pregunta: La corrupción es un problema recurrente. ¿Qué mecanismo implementará para garantizar la transparencia de su gestión? Respuesta: Implementaremos el "Sistema de Transparencia 360". Cada contrato superior a $50 millones será publicado en línea, con seguimiento en tiempo real del estado de ejecución, las facturas y los informes de interventoría. La ciudadanía podrá hacer comentarios y denuncias directamente en la plataforma, las cuales serán revisadas por un equipo especial de la Oficina de Transparencia.
-
-Pregunta: ¿Cómo garantizará que los cargos públicos se asignen por mérito y no por favores políticos? Respuesta: Crearemos el "Banco de Talento Público del Quindío". Los perfiles de los candidatos a cargos de libre nombramiento y remoción serán evaluados por una comisión externa, que garantizará que los nombramientos se hagan con base en la experiencia, la trayectoria y la idoneidad profesional, y no en la cercanía política.
-
-________________________________________
-
-Relaciones Interinstitucionales y Ciudadanía
-
-Pregunta: ¿Cómo planea trabajar con el Gobierno Nacional para traer recursos al Quindío? Respuesta: Crearemos una "Oficina de Proyectos Estratégicos" que se encargará de identificar y formular proyectos viables que cumplan con los lineamientos del Plan Nacional de Desarrollo. Con esto, buscaremos una inversión de al menos $150.000 millones en los primeros 2 años para proyectos de infraestructura vial y turística.
-
-Pregunta: ¿Qué espacio tendrán los jóvenes y las mujeres en su gobierno? Respuesta: Crearemos el "Gabinete Joven" y el "Gabinete Femenino", con reuniones trimestrales directas conmigo para la formulación de políticas públicas. El 40% de los cargos de dirección y coordinación en mi gobierno estarán ocupados por mujeres y jóvenes menores de 35 años.
-
-Pregunta: ¿Cuál es su mensaje para los quindianos que viven en el exterior y quieren contribuir al desarrollo del departamento? Respuesta: Abriremos la "Ventana Quindiana", una plataforma digital para que los quindianos en el exterior puedan invertir en proyectos de desarrollo local, ya sea a través de capital semilla o compartiendo su conocimiento a través de mentorías virtuales a emprendedores.
-
-Pregunta: ¿Cómo fomentará la participación ciudadana en su administración? Respuesta: Realizaremos un "Diálogo de Gobierno" anual en cada uno de los 12 municipios, donde presentaré los avances de mi gestión y responderé directamente a las preguntas de la ciudadanía. Todos los planes de inversión serán sometidos a audiencias públicas.
-
-Pregunta: ¿Cuál es su visión sobre el futuro de los municipios de la cordillera, como Salento y Córdoba? Respuesta: Mi visión es de "turismo de baja huella". Apoyaré a los emprendimientos locales de ecoturismo y gastronomía, y trabajaré con los Parques Nacionales para proteger el Valle de Cocora y las reservas naturales, limitando la capacidad de carga para evitar la masificación.
-
-Pregunta: ¿Qué hará para fortalecer la conexión entre la capital (Armenia) y el resto de los municipios? Respuesta: Implementaremos un sistema de transporte público intermunicipal más eficiente. Coordinaremos con las alcaldías para la construcción de una central de transferencia de pasajeros en Armenia. Además, trabajaremos en la mejora de las vías principales que conectan a la capital con los municipios.
-
-________________________________________
-
-Temas Complementarios
-
-Pregunta: ¿Cuál es su postura sobre el futuro de la industria turística post-pandemia? Respuesta: La pandemia nos enseñó a valorar el turismo de naturaleza. Invertiremos $1.000 millones en la promoción del Quindío como un "destino de bienestar", con énfasis en el agroturismo y las experiencias en fincas cafeteras.
-
-Pregunta: ¿Qué opina sobre la relación entre el gobierno y el sector privado? Respuesta: El sector privado es un socio, no un rival. Crearemos una "Mesa de Fomento a la Inversión" que se reunirá mensualmente para identificar cuellos de botella y crear un marco normativo que facilite la creación de empresas y la generación de empleo en el departamento.
-
-Pregunta: ¿Qué propone para el sector rural, más allá de la producción? Respuesta: Implementaremos el programa "Campo Conectado". Trabajaremos con las empresas de telecomunicaciones para llevar conectividad satelital a 100 veredas, facilitando el acceso a educación a distancia, teletrabajo y comercio electrónico para los productores.
-
-Pregunta: ¿Cuál es su posición frente a la minería ilegal y los cultivos ilícitos? Respuesta: Tolerancia cero. Crearemos un grupo élite con la Policía y el Ejército para desmantelar las estructuras de minería ilegal, con el uso de drones de vigilancia en las zonas críticas. Implementaremos un programa de sustitución voluntaria de cultivos ilícitos, ofreciendo a las familias campesinas alternativas productivas y apoyo técnico.
-
-Pregunta: ¿Qué hará para proyectar la marca "Quindío" a nivel nacional e internacional? Respuesta: Invertiremos $500 millones en una campaña de marketing digital en plataformas como Google y redes sociales para atraer a turistas de Estados Unidos, Canadá y España. La campaña estará centrada en el Paisaje Cultural Cafetero y en las experiencias únicas de la región, destacando al Quindío como el corazón de Colombia.
-
-Preguntas y Respuestas Adicionales
-
-Pregunta: ¿Cuál es su postura frente a la sostenibilidad de las fincas cafeteras familiares ante la fluctuación del precio del café? Respuesta: Defenderemos el precio interno del café. Crearemos un Fondo de Estabilización de Precios de $1.000 millones, capitalizado con aportes departamentales y cooperación internacional, para subsidiar a los pequeños productores cuando el precio por carga de café caiga por debajo del costo de producción.
-
-Pregunta: ¿Cómo piensa impulsar la economía circular y el reciclaje a nivel departamental? Respuesta: Implementaremos un Programa de Incentivos al Reciclaje. Las familias y empresas que certifiquen el 80% de su separación en la fuente recibirán un descuento del 5% en su impuesto predial, y las empresas recicladoras formales obtendrán un subsidio para la compra de maquinaria.
-
-Pregunta: ¿Cuál es su plan para mejorar la calidad de vida de los adultos mayores en el Quindío? Respuesta: Lanzaremos el programa "Mayores Productivos". En alianza con el SENA, ofreceremos talleres de oficios y manualidades. Crearemos un fondo para la comercialización de sus productos en ferias locales y en plataformas digitales, garantizándoles una fuente de ingresos digna.
-
-Pregunta: ¿Cómo enfrentará el desafío de la infraestructura para personas con discapacidad? Respuesta: Exigiremos que en toda obra pública nueva (parques, andenes, edificios) se incorporen rampas, señalización braille y senderos podotáctiles. Destinaremos $500 millones para adecuar los espacios públicos existentes en las cabeceras municipales.
-
-Pregunta: ¿Qué hará para fortalecer la identidad cultural del Paisaje Cultural Cafetero ante la globalización? Respuesta: Impulsaremos la enseñanza del patrimonio cultural cafetero en los colegios a través de una cátedra obligatoria. Financiaré la creación de "Rutas de Sabores y Saberes" para que los turistas puedan interactuar con artesanos, baristas y arrieros.
-
-Pregunta: ¿Cuál es su estrategia para atraer inversiones extranjeras al departamento? Respuesta: Crearemos una oficina de "Ventanilla Única" para la inversión extranjera, que agilizará los trámites de registro de empresas en un 50%. Acompañaremos a los inversionistas en todo el proceso y les ofreceremos beneficios fiscales en zonas de desarrollo prioritario.
-
-Pregunta: ¿Cómo se relacionará con las minorías étnicas y comunidades indígenas presentes en el Quindío? Respuesta: Conformaré la Mesa de Diálogo Étnico, con participación permanente de los líderes indígenas y afrocolombianos. Garantizaremos el respeto a sus territorios ancestrales y co-crearemos políticas públicas para la preservación de su cultura y la mejora de su calidad de vida.
-
-Pregunta: ¿Qué propone para el manejo de los animales domésticos y la protección de la fauna silvestre? Respuesta: Destinaremos $400 millones para construir y operar un Centro de Bienestar Animal en Armenia, que ofrecerá servicios de esterilización gratuita, vacunación y atención veterinaria de bajo costo. Además, fortaleceremos la autoridad ambiental para combatir el tráfico de fauna silvestre.
-
-Pregunta: ¿Qué hará para garantizar la seguridad alimentaria de las familias vulnerables? Respuesta: Fortaleceremos los bancos de alimentos y crearemos la Red de Huertas Comunitarias. Suministraremos capital semilla, herramientas y asistencia técnica a 500 familias vulnerables para que puedan sembrar sus propios alimentos orgánicos.
-
-Pregunta: ¿Cómo abordará el problema de los habitantes de calle en las principales ciudades del departamento? Respuesta: Mi enfoque será integral. En coordinación con la Secretaría de Salud y Bienestar Social, activaremos brigadas móviles que ofrezcan atención psicológica, de salud y programas de resocialización y capacitación para el empleo. No los criminalizaremos, los apoyaremos.
-
-Pregunta: ¿Cuál es su visión para el Aeropuerto Internacional El Edén? Respuesta: Buscaremos convertirlo en un hub logístico y de carga aérea. Impulsaremos la inversión para la expansión de su infraestructura, atrayendo a aerolíneas de bajo costo y de carga, lo que potenciará la exportación de nuestros productos agrícolas.
-
-Pregunta: ¿Cómo impulsará la industria de eventos y congresos en el departamento? Respuesta: Crearemos el "Fondo de Promoción de Eventos" de $500 millones, que cofinanciará la realización de congresos y eventos nacionales e internacionales en el Quindío. Esto dinamizará la hotelería, el comercio y el turismo.
-
-Pregunta: ¿Cuál es su postura frente a la exploración de recursos no renovables en el Quindío? Respuesta: Mi postura es de defensa total de nuestro patrimonio natural y hídrico. No permitiré la exploración ni la explotación de petróleo o minerales en el departamento. Nuestro oro es el agua, el café y el turismo sostenible.
-
-Pregunta: ¿Qué hará para apoyar a las comunidades campesinas que no se dedican al café? Respuesta: Diversificaremos el apoyo agrícola a otros productos como el aguacate, la mora y los cítricos. Crearemos centros de acopio y facilitaremos la comercialización directa con grandes cadenas de supermercados y exportadores, eliminando intermediarios.
-
-Pregunta: ¿Cómo fortalecerá la infraestructura tecnológica y la conectividad en las zonas rurales? Respuesta: En alianza con el Ministerio de las TIC, buscaremos la instalación de 100 puntos de Wi-Fi gratuito en parques y zonas comunes de los municipios y veredas más apartadas.
-
-Pregunta: ¿Qué propone para el desarrollo de la economía naranja en el Quindío? Respuesta: Crearemos la "Incubadora de Emprendimientos Creativos" en alianza con las universidades. Ofreceremos capital semilla, asesoría en propiedad intelectual y mercadeo a los proyectos de cine, música, diseño y artesanías.
-
-Pregunta: ¿Cómo promoverá el Quindío como un destino de turismo de aventura y deportivo? Respuesta: Invertiremos en la adecuación de senderos para senderismo y ciclismo de montaña, con señalización y puntos de asistencia. Organizaremos anualmente un Festival de Deportes de Aventura que atraiga a turistas nacionales e internacionales.
-
-Pregunta: ¿Qué hará para que las instituciones educativas estén más conectadas con el mercado laboral? Respuesta: Conformaremos mesas de trabajo entre rectores universitarios, directores del SENA y gremios empresariales para que la oferta académica responda a las necesidades de la región. El objetivo es que el 80% de los egresados encuentren empleo en los primeros 6 meses.
-
-Pregunta: ¿Cuál es su plan para dignificar el trabajo de los recicladores y de la población que vive del rebusque? Respuesta: Formalizaremos a las cooperativas de recicladores y les brindaremos apoyo técnico y económico para la compra de vehículos y maquinaria. Apoyaremos a los vendedores informales en la creación de asociaciones y les asignaremos espacios de trabajo dignos.
-
-Pregunta: ¿Qué propone para garantizar el acceso a la justicia y los servicios de las entidades públicas en las zonas más apartadas? Respuesta: Crearemos las "Jornadas de Gobierno Móvil". Brigadas de funcionarios de la Gobernación, la Registraduría y la Defensoría del Pueblo se trasladarán a los municipios y veredas más lejanas, llevando servicios como la expedición de documentos, asesoría jurídica y atención social.
-
-
-
-5.1. Hoja de Vida y Transparencia Financiera
-
-Javier Montoya es un líder con una trayectoria pública y privada impecable. Su experiencia no es un misterio; es el pilar de su capacidad para gobernar. A continuación, un resumen de su perfil y su compromiso con la transparencia.
-
-Hoja de Vida:
-
-Educación: Ingeniero Agroindustrial, Universidad del Quindío (2000). Especialización en Gerencia de Proyectos, Universidad EAFIT (2006).
-
-Experiencia Laboral:
-
-2007 - 2015: Fundador y Gerente General de "Cafés Especiales Quindío", empresa exportadora que llevó la marca regional a mercados en Europa y Asia.
-
-2016 - 2019: Secretario de Desarrollo Económico de Armenia. Lideró la creación del "Fondo Emprende" y la atracción de 5 empresas de tecnología, generando más de 1.500 empleos.
-
-2020 - 2024: Consultor privado en agronegocios y sostenibilidad.
-
-Declaración de Renta: Javier Montoya ha publicado un resumen de su declaración de renta y bienes de 2024, demostrando su compromiso con la transparencia. Sus ingresos provienen exclusivamente de su actividad profesional como consultor. No posee contratos con el Estado, ni ha sido investigado por ningún órgano de control.
-
-________________________________________
-
-5.2. Aclaraciones y Rumores Comunes
-
-En una campaña limpia, los rumores deben enfrentarse con la verdad. Javier Montoya no tiene nada que ocultar.
-
-Rumor 1: "Javier Montoya es un empresario sin experiencia política".
-
-Aclaración: La experiencia de Javier es la de un gestor. Como Secretario de Desarrollo Económico de Armenia, lideró políticas públicas, gestionó presupuestos de más de $50.000 millones y supervisó a más de 100 funcionarios. Su enfoque no es el de un político de carrera, sino el de un líder que logra resultados.
-
-Rumor 2: "Los recursos de la campaña de Montoya provienen de grandes financiadores externos".
-
-Aclaración: La campaña de Renovación Quindiana está financiada por más de 300 donantes, en su mayoría pequeños y medianos empresarios del Quindío, caficultores, profesionales y ciudadanos que creen en su visión. El 80% de los aportes no superan los 5 millones de pesos, demostrando que este es un proyecto de la gente.
-
-________________________________________
-
-5.3. Testimonios y Apoyos Públicos
-
-La mejor prueba de un buen liderazgo es el respaldo de la gente que lo conoce y ha trabajado con él.
-
-Marcela Pérez, Caficultora de Génova: "Cuando el precio del café se cayó, Javier Montoya fue el único que nos ayudó a crear una marca para venderlo a un mejor precio. Él sabe que nuestro futuro está en el campo, y no en la política de oficina."
-
-Carlos Ochoa, Emprendedor Tecnológico de Armenia: "Gracias a los programas que Javier impulsó cuando fue Secretario, mi empresa de software pudo crecer y hoy empleo a más de 20 jóvenes de la región. Él entiende que la tecnología es el futuro del Quindío."
-
-Laura Torres, Líder Comunitaria de La Tebaida: "Javier no es solo un candidato que viene a prometer. Él ha caminado nuestros barrios, conoce nuestras necesidades y, lo más importante, tiene un plan claro y detallado para la seguridad y el empleo de nuestra gente."
-
-________________________________________
-
-5.4. Sostenibilidad y Finanzas de la Campaña
-
-La transparencia es un pilar de nuestra gestión. Por eso, hemos dispuesto la información sobre el financiamiento y presupuesto de nuestra campaña.
-
-Presupuesto: El presupuesto de la campaña se estima en $1.500 millones, distribuidos de la siguiente manera:
-
-Publicidad y Medios Digitales: 40%
-
-Movilización y Eventos en Territorio: 30%
-
-Logística y Funcionamiento: 20%
-
-Reservas para Imprevistos: 10%
-
-Fuentes de Financiación: La campaña de Renovación Quindiana se financia de manera transparente y ética. Las fuentes de ingreso provienen principalmente de donaciones de personas naturales (80%) y de empresas locales (20%) comprometidas con el desarrollo regional. No aceptamos donaciones de empresas con contratos públicos ni de personas investigadas por la justicia.
-
-________________________________________
-
-5.5. Llamado a la Participación Ciudadana
+# --- MÉTRICAS Y LOGS ESTRUCTURADOS ---
+# Métricas en memoria del worker, expuestas en formato Prometheus en /metrics
+# (cada worker de gunicorn se raspa por separado). Los logs son JSON de una
+# línea con el ID de la petición, para poder seguir un mensaje de punta a punta.
+_request_id = contextvars.ContextVar("request_id", default="-")
+_inicio_peticion = contextvars.ContextVar("inicio_peticion", default=None)
+_tiempos = contextvars.ContextVar("tiempos", default=None)
+
+def log(mensaje, nivel="info", **campos):
+    registro = {"ts": round(time.time(), 3), "nivel": nivel, "request_id": _request_id.get(), "mensaje": mensaje}
+    registro.update(campos)
+    # Una sola escritura por línea: con varios workers o hilos sobre el mismo stdout,
+    # print() escribe el JSON y el salto de línea por separado y las líneas se mezclan.
+    sys.stdout.write(json.dumps(registro, ensure_ascii=False, default=str) + "\n")
+    sys.stdout.flush()
+
+def iniciar_peticion(request_id=None, inicio=None):
+    """Fija el ID y el reloj de la petición en curso (también en los hilos de la cola)."""
+    _request_id.set(request_id or uuid.uuid4().hex)
+    _inicio_peticion.set(inicio or time.time())
+    _tiempos.set({})
+
+def tiempos_peticion():
+    return _tiempos.get() or {}
+
+class Histograma:
+
+    def __init__(self, nombre, ayuda, limites, etiqueta=None):
+        self.nombre, self.ayuda, self.limites, self.etiqueta = nombre, ayuda, limites, etiqueta
+        self._lock = threading.Lock()
+        self._series = {}  # valor de la etiqueta -> [conteos por límite, suma, total]
+
+    def observar(self, valor, valor_etiqueta=""):
+        with self._lock:
+            serie = self._series.setdefault(valor_etiqueta, [[0] * len(self.limites), 0.0, 0])
+            for i, limite in enumerate(self.limites):
+                if valor <= limite:
+                    serie[0][i] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        with self._lock:
+            series = sorted((k, list(v[0]), v[1], v[2]) for k, v in self._series.items())
+        for valor_etiqueta, conteos, suma, total in series:
+            base = f'{self.etiqueta}="{valor_etiqueta}"' if self.etiqueta else ""
+            for limite, conteo in zip([str(l) for l in self.limites] + ["+Inf"], conteos + [total]):
+                etiquetas = ",".join(x for x in (base, f'le="{limite}"') if x)
+                lineas.append(f"{self.nombre}_bucket{{{etiquetas}}} {conteo}")
+            sufijo = f"{{{base}}}" if base else ""
+            lineas.append(f"{self.nombre}_sum{sufijo} {suma}")
+            lineas.append(f"{self.nombre}_count{sufijo} {total}")
+        return "\n".join(lineas)
+
+class Contador:
+
+    def __init__(self, nombre, ayuda, etiqueta=None):
+        self.nombre, self.ayuda, self.etiqueta = nombre, ayuda, etiqueta
+        self._lock = threading.Lock()
+        self._valores = {}
+
+    def incrementar(self, valor_etiqueta="", cantidad=1):
+        with self._lock:
+            self._valores[valor_etiqueta] = self._valores.get(valor_etiqueta, 0) + cantidad
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} counter"]
+        with self._lock:
+            valores = sorted(self._valores.items())
+        for valor_etiqueta, valor in valores:
+            sufijo = f'{{{self.etiqueta}="{valor_etiqueta}"}}' if self.etiqueta else ""
+            lineas.append(f"{self.nombre}{sufijo} {valor}")
+        return "\n".join(lineas)
+
+class Indicador:
+    """Valor leído al exponer (profundidad de la cola, estado del circuito...)."""
+
+    def __init__(self, nombre, ayuda, funcion):
+        self.nombre, self.ayuda, self.funcion = nombre, ayuda, funcion
+
+    def exponer(self):
+        return f"# HELP {self.nombre} {self.ayuda}\n# TYPE {self.nombre} gauge\n{self.nombre} {float(self.funcion())}"
+
+LIMITES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LATENCIA_ETAPAS = Histograma("candidato_etapa_segundos", "Duración de cada etapa del pipeline.", LIMITES_SEGUNDOS, "etapa")
+TOKENS = Histograma("candidato_tokens", "Tokens por petición a GPT-4.", (100, 250, 500, 1000, 1500, 2000, 3000, 4000), "tipo")
+MENSAJES = Contador("candidato_mensajes_total", "Mensajes recibidos en /whatsapp por modo.", "modo")
+CACHE_EMBEDDINGS = Contador("candidato_cache_embeddings_total", "Búsquedas en la caché de embeddings.", "resultado")
+CACHE_RESPUESTAS = Contador("candidato_cache_respuestas_total", "Búsquedas en la caché semántica de respuestas.", "resultado")
+FAQ = Contador("candidato_faq_total", "Búsquedas en las preguntas frecuentes.", "resultado")
+RECUPERACIONES = Contador("candidato_recuperaciones_total", "Búsquedas en la base de conocimiento por camino.", "camino")
+METRICAS = [LATENCIA_ETAPAS, TOKENS, MENSAJES, CACHE_EMBEDDINGS, CACHE_RESPUESTAS, FAQ, RECUPERACIONES]
+
+@contextmanager
+def medir(etapa):
+    """Mide una etapa: alimenta el histograma y el registro de tiempos de la petición."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracion = time.perf_counter() - inicio
+        LATENCIA_ETAPAS.observar(duracion, etapa)
+        tiempos = _tiempos.get()
+        if tiempos is not None:
+            tiempos[etapa] = round(duracion * 1000, 1)
+
+def observar_desde_inicio(etapa):
+    """Registra el tiempo transcurrido desde que llegó la petición (p. ej. hasta el primer mensaje)."""
+    inicio = _inicio_peticion.get()
+    if inicio is None:
+        return
+    duracion = time.time() - inicio
+    LATENCIA_ETAPAS.observar(duracion, etapa)
+    tiempos = _tiempos.get()
+    if tiempos is not None:
+        tiempos[etapa] = round(duracion * 1000, 1)
+
+CHROMA_PATH = os.getenv("CHROMA_PATH", "./chroma_db")
+CHROMA_COLECCION = "candidato_ia_stable"
+_chroma = {"pid": None, "coleccion": None}
+_chroma_lock = threading.Lock()
+
+def obtener_coleccion():
+    """Colección de Chroma del proceso actual.
+
+    El cliente se crea de forma perezosa y se recrea tras un fork: un
+    PersistentClient (y su conexión SQLite) no debe compartirse entre procesos.
+    """
+    with _chroma_lock:
+        if _chroma["pid"] != os.getpid():
+            if _chroma["pid"] is not None:
+                # Chroma reutiliza el sistema por ruta; descartamos el heredado del proceso padre.
+                from chromadb.api.client import SharedSystemClient
+                if hasattr(SharedSystemClient, "clear_system_cache"):
+                    SharedSystemClient.clear_system_cache()
+            cliente = chromadb.PersistentClient(path=CHROMA_PATH)
+            _chroma["coleccion"] = cliente.get_or_create_collection(name=CHROMA_COLECCION)
+            _chroma["pid"] = os.getpid()
+        return _chroma["coleccion"]
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+# Máximo de textos por llamada a la API de embeddings al (re)indexar.
+EMBEDDING_LOTE = int(os.getenv("EMBEDDING_LOTE", "500"))
+
+def id_fragmento(texto):
+    """ID estable derivado del contenido: si el texto no cambia, el ID tampoco."""
+    return "chunk_" + hashlib.sha256(texto.encode("utf-8")).hexdigest()[:32]
+
+# --- FRAGMENTACIÓN DE DOCUMENTOS ---
+# Fragmentos densos que respetan secciones y pares pregunta/respuesta, medidos
+# en tokens del mismo tokenizador que usan ada-002 y GPT-4.
+CHUNK_TOKENS_MAX = int(os.getenv("CHUNK_TOKENS_MAX", "350"))
+_SEPARADOR_SECCION = re.compile(r'^\s*_{10,}\s*$', re.MULTILINE)
+_TITULO_NUMERADO = re.compile(r'^\d+(\.\d+)*\.\s+\S')
+# Elemento de lista con rótulo: "Defensa del Territorio: Mi posición es...".
+_ELEMENTO_LISTA = re.compile(r'^[^:?!.]{2,60}:\s+\S')
+_TITULO_MARKDOWN = re.compile(r'^(?P<nivel>#{1,6})\s+(?P<titulo>.+?)\s*#*$')
+_PREGUNTA_RESPUESTA = re.compile(r'^Pregunta:\s*(?P<pregunta>.+?)\s*Respuesta:\s*(?P<respuesta>.+)$', re.DOTALL)
+_codificador = None
+
+def contar_tokens(texto):
+    global _codificador
+    if _codificador is None:
+        _codificador = tiktoken.get_encoding("cl100k_base")
+    return len(_codificador.encode(texto))
+
+def _es_subtitulo(linea, siguiente):
+    """Línea corta sin puntuación final seguida de un párrafo: "Pilar 1: ...", "Hoja de Vida:"."""
+    return len(linea) <= 60 and linea[-1] not in '.?!)%' and len(siguiente) > 60
+
+def _es_lista(lineas):
+    """Dos líneas seguidas con rótulo son una lista; una sola suele ser prosa con dos puntos
+    ("Mi experiencia es la combinación ideal: ...")."""
+    return len(lineas) >= 2 and all(_ELEMENTO_LISTA.match(l) for l in lineas[:2])
+
+def _dividir_por_tokens(texto, limite):
+    """Parte un texto demasiado largo en trozos de oraciones completas."""
+    partes, actual = [], ""
+    for oracion in re.split(r'(?<=[.?!])\s+', texto):
+        candidato = f"{actual} {oracion}".strip()
+        if actual and contar_tokens(candidato) > limite:
+            partes.append(actual)
+            actual = oracion
+        else:
+            actual = candidato
+    if actual:
+        partes.append(actual)
+    return partes
+
+def fragmentar_documento(documento, limite=CHUNK_TOKENS_MAX):
+    """Divide un documento (texto plano o Markdown) respetando secciones y pares pregunta/respuesta.
+
+    Devuelve [(texto, metadatos)]. Cada fragmento empieza con el título de su
+    sección (y subsección); los párrafos consecutivos se empaquetan hasta
+    `limite` tokens y cada par pregunta/respuesta va en su propio fragmento.
+    """
+    fragmentos = []
+    for bloque in _SEPARADOR_SECCION.split(documento):
+        lineas = [l.replace('•', '').strip() for l in bloque.splitlines()]
+        lineas = [l for l in lineas if l]
+        if not lineas:
+            continue
+        seccion, lineas = lineas[0], lineas[1:]
+        titulo = _TITULO_MARKDOWN.match(seccion)
+        if titulo:
+            seccion = titulo.group("titulo")
+        subseccion = ""
+        paquete, tokens_paquete = [], 0
+
+        def emitir(textos, tipo):
+            encabezado = f"{seccion} > {subseccion}" if subseccion else seccion
+            cuerpo = "\n".join(textos)
+            presupuesto = limite - contar_tokens(encabezado) - 1
+            partes = [cuerpo] if contar_tokens(cuerpo) <= presupuesto else _dividir_por_tokens(cuerpo, presupuesto)
+            # Un par partido en varios fragmentos ya no es autocontenido.
+            tipo = tipo if len(partes) == 1 else "texto"
+            for parte in partes:
+                fragmentos.append((f"{encabezado}\n{parte}", {"seccion": seccion, "subseccion": subseccion, "tipo": tipo}))
+
+        i = 0
+        while i < len(lineas):
+            linea = lineas[i]
+            siguiente = lineas[i + 1] if i + 1 < len(lineas) else None
+            es_par = _PREGUNTA_RESPUESTA.match(linea) is not None
+            # "¿Cómo lo haremos?" seguido de una lista no es un par: la pregunta
+            # abre un paquete nuevo y la lista queda junta debajo de ella.
+            introduce_lista = linea.endswith('?') and _es_lista(lineas[i + 1:i + 3])
+            if introduce_lista and paquete:
+                emitir(paquete, "texto")
+                paquete, tokens_paquete = [], 0
+            if es_par or (linea.endswith('?') and siguiente and not introduce_lista):
+                if paquete:
+                    emitir(paquete, "texto")
+                    paquete, tokens_paquete = [], 0
+                unidad = [linea] if es_par else [linea, siguiente]
+                emitir(unidad, "pregunta_respuesta")
+                i += len(unidad)
+                continue
+            markdown = _TITULO_MARKDOWN.match(linea)
+            numerado = len(linea) <= 80 and _TITULO_NUMERADO.match(linea) is not None
+            if markdown or numerado or (siguiente and _es_subtitulo(linea, siguiente)):
+                if paquete:
+                    emitir(paquete, "texto")
+                    paquete, tokens_paquete = [], 0
+                # "5.1. Hoja de Vida ..." y "# / ##" abren una sección nueva aunque no
+                # haya separador; "###" y más profundos son subsecciones.
+                if markdown and len(markdown.group("nivel")) <= 2:
+                    seccion, subseccion = markdown.group("titulo"), ""
+                elif markdown:
+                    subseccion = markdown.group("titulo")
+                elif numerado:
+                    seccion, subseccion = linea, ""
+                else:
+                    subseccion = linea
+                i += 1
+                continue
+            tokens_linea = contar_tokens(linea) + 1
+            if paquete and tokens_paquete + tokens_linea > limite:
+                emitir(paquete, "texto")
+                paquete, tokens_paquete = [], 0
+            paquete.append(linea)
+            tokens_paquete += tokens_linea
+            i += 1
+        if paquete:
+            emitir(paquete, "texto")
+    return fragmentos
+
+# --- CLIENTE OPENAI: SESIÓN COMPARTIDA, TIMEOUTS, REINTENTOS Y CORTACIRCUITOS ---
+# Una llamada lenta o un incidente de OpenAI no debe dejar workers colgados:
+# toda llamada tiene timeouts, los reintentos están acotados por un presupuesto
+# global y, si los fallos se acumulan, se responde de inmediato con el error.
+OPENAI_API_BASE = os.getenv("OPENAI_API_BASE")  # p. ej. un servidor falso local para pruebas
+OPENAI_POOL = int(os.getenv("OPENAI_POOL", "20"))
+OPENAI_TIMEOUT_CONEXION = float(os.getenv("OPENAI_TIMEOUT_CONEXION", "3"))
+OPENAI_TIMEOUT_EMBEDDING = float(os.getenv("OPENAI_TIMEOUT_EMBEDDING", "10"))
+OPENAI_TIMEOUT_CHAT = float(os.getenv("OPENAI_TIMEOUT_CHAT", "60"))
+OPENAI_REINTENTOS = int(os.getenv("OPENAI_REINTENTOS", "3"))
+# Plazo total de una llamada, reintentos y esperas incluidos: en el modo síncrono,
+# Twilio abandona el webhook a los 15 s.
+OPENAI_PLAZO = float(os.getenv("OPENAI_PLAZO", "14"))
+OPENAI_ESPERA_BASE = float(os.getenv("OPENAI_ESPERA_BASE", "0.5"))
+OPENAI_ESPERA_MAX = float(os.getenv("OPENAI_ESPERA_MAX", "8"))
+# Cada llamada exitosa suma esta fracción de reintento al presupuesto (tope: OPENAI_REINTENTOS_MAX).
+OPENAI_PRESUPUESTO_REINTENTOS = float(os.getenv("OPENAI_PRESUPUESTO_REINTENTOS", "0.1"))
+OPENAI_REINTENTOS_MAX = float(os.getenv("OPENAI_REINTENTOS_MAX", "10"))
+OPENAI_CIRCUITO_FALLOS = int(os.getenv("OPENAI_CIRCUITO_FALLOS", "5"))
+OPENAI_CIRCUITO_PAUSA = float(os.getenv("OPENAI_CIRCUITO_PAUSA", "30"))
+
+if OPENAI_API_BASE:
+    openai.api_base = OPENAI_API_BASE
+
+class CircuitoAbierto(Exception):
+    """OpenAI está fallando de forma sostenida; se falla sin intentar la llamada."""
+
+class SesionOpenAI(requests.Session):
+    """Sesión HTTP keep-alive compartida por todos los hilos del proceso.
+
+    El SDK guarda la sesión por hilo y la cierra cada 180 s; como es la misma para
+    todos, ese cierre vaciaría el pool de todos los hilos y se ignora. Tras un fork
+    se montan adaptadores nuevos: las conexiones del proceso padre no se comparten.
+    """
 
-El Quindío de hoy no se construirá solo con un líder, sino con la participación de todos.
+    def __init__(self):
+        super().__init__()
+        self.renovar_conexiones()
+
+    def renovar_conexiones(self):
+        # Los reintentos los decide ClienteOpenAI.llamar(), no urllib3.
+        adaptador = HTTPAdapter(pool_connections=OPENAI_POOL, pool_maxsize=OPENAI_POOL, max_retries=0)
+        self.mount("https://", adaptador)
+        self.mount("http://", adaptador)
+
+    def close(self):
+        pass
+
+class ClienteOpenAI:
+    """Envuelve las llamadas del SDK de openai con la política de resiliencia."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sesion = SesionOpenAI()
+        self._fichas = OPENAI_REINTENTOS_MAX
+        self._fallos_seguidos = 0
+        self._abierto_hasta = 0.0
+        self._sondeando = False
+
+    @property
+    def circuito_abierto(self):
+        return self._fallos_seguidos >= OPENAI_CIRCUITO_FALLOS
+
+    def _permitir(self):
+        with self._lock:
+            if not self.circuito_abierto:
+                return
+            if time.monotonic() < self._abierto_hasta or self._sondeando:
+                raise CircuitoAbierto("Circuito de OpenAI abierto por fallos consecutivos.")
+            # Semiabierto: se deja pasar una sola llamada de prueba.
+            self._sondeando = True
+
+    def _registrar(self, resultado):
+        with self._lock:
+            self._sondeando = False
+            if resultado == "exito":
+                self._fallos_seguidos = 0
+                self._fichas = min(self._fichas + OPENAI_PRESUPUESTO_REINTENTOS, OPENAI_REINTENTOS_MAX)
+            elif resultado == "fallo":
+                self._fallos_seguidos += 1
+                if self.circuito_abierto:
+                    self._abierto_hasta = time.monotonic() + OPENAI_CIRCUITO_PAUSA
+
+    def _tomar_ficha(self):
+        with self._lock:
+            if self._fichas >= 1:
+                self._fichas -= 1
+                return True
+            return False
+
+    @staticmethod
+    def es_reintentable(e):
+        """429, 5xx, timeouts y errores de conexión; los errores del cliente (4xx) no."""
+        if isinstance(e, (openai.error.RateLimitError, openai.error.Timeout, openai.error.APIConnectionError,
+                          openai.error.ServiceUnavailableError, openai.error.TryAgain)):
+            return True
+        return isinstance(e, openai.error.APIError) and (e.http_status or 500) >= 500
+
+    def llamar(self, funcion, timeout_lectura, plazo=None, **kwargs):
+        """Llama a `funcion` con reintentos, sin pasar de `plazo` segundos en total."""
+        limite = time.monotonic() + (OPENAI_PLAZO if plazo is None else plazo)
+        intento = 0
+        while True:
+            self._permitir()
+            restante = limite - time.monotonic()
+            try:
+                resultado = funcion(request_timeout=(min(OPENAI_TIMEOUT_CONEXION, restante), min(timeout_lectura, restante)),
+                                    **kwargs)
+            except Exception as e:
+                reintentable = self.es_reintentable(e)
+                self._registrar("fallo" if reintentable else "neutro")
+                if not reintentable or intento >= OPENAI_REINTENTOS or not self._tomar_ficha():
+                    raise
+                # Backoff exponencial con jitter completo.
+                espera = random.uniform(0, min(OPENAI_ESPERA_MAX, OPENAI_ESPERA_BASE * 2 ** intento))
+                if time.monotonic() + espera >= limite:
+                    raise  # no queda plazo para otro intento
+                intento += 1
+                log(f"OpenAI falló ({e.__class__.__name__}); reintento {intento}/{OPENAI_REINTENTOS} en {espera:.2f}s", nivel="warning")
+                time.sleep(espera)
+                continue
+            self._registrar("exito")
+            return resultado
+
+cliente_openai = ClienteOpenAI()
+# El SDK pide la sesión por hilo; todos reciben la sesión compartida del proceso.
+openai.requestssession = cliente_openai.sesion
+if hasattr(os, "register_at_fork"):  # no existe en Windows, donde tampoco hay fork
+    os.register_at_fork(after_in_child=cliente_openai.sesion.renovar_conexiones)
+
+# --- CACHÉ PERSISTENTE DE EMBEDDINGS ---
+# Compartida por la indexación y por las preguntas entrantes: una pregunta
+# repetida no vuelve a pagar la ida y vuelta a la API de embeddings.
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.sqlite3")
+EMBEDDING_CACHE_MAX = int(os.getenv("EMBEDDING_CACHE_MAX", "50000"))
+# Un acierto solo reescribe `ultimo_uso` si es más viejo que esto: para expulsar las
+# entradas frías basta esa resolución, y así casi ninguna lectura escribe en el archivo.
+EMBEDDING_CACHE_REFRESCO = float(os.getenv("EMBEDDING_CACHE_REFRESCO", "3600"))
+
+def normalizar_texto(texto):
+    """Colapsa espacios en blanco; es el texto que realmente se envía a embeber."""
+    return " ".join(texto.split())
+
+class CacheEmbeddings:
+    """Caché LRU en SQLite con clave (modelo, texto normalizado).
+
+    La conexión se abre de forma perezosa y se reabre si el proceso cambió
+    (p. ej. tras el fork de gunicorn), por lo que es segura entre workers.
+    """
 
-Canales de Contacto:
+    def __init__(self, path, max_entradas):
+        self.path = path
+        self.max_entradas = max_entradas
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._inserciones = 0
+
+    def _conexion(self):
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "clave TEXT PRIMARY KEY, vector BLOB NOT NULL, ultimo_uso REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_ultimo_uso ON embeddings (ultimo_uso)")
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    @staticmethod
+    def clave(modelo, texto):
+        return hashlib.sha256(f"{modelo}\x00{normalizar_texto(texto).casefold()}".encode("utf-8")).hexdigest()
+
+    def obtener(self, claves):
+        """Devuelve {clave: vector} para las claves presentes y refresca su uso si es viejo."""
+        if not claves:
+            return {}
+        encontrados, viejas = {}, []
+        ahora = time.time()
+        with self._lock:
+            conn = self._conexion()
+            unicas = list(set(claves))
+            for inicio in range(0, len(unicas), 500):
+                lote = unicas[inicio:inicio + 500]
+                marcas = ",".join("?" * len(lote))
+                for clave, blob, ultimo_uso in conn.execute(
+                        f"SELECT clave, vector, ultimo_uso FROM embeddings WHERE clave IN ({marcas})", lote):
+                    encontrados[clave] = array('f', blob).tolist()
+                    if ahora - ultimo_uso >= EMBEDDING_CACHE_REFRESCO:
+                        viejas.append(clave)
+            if viejas:
+                try:
+                    conn.executemany("UPDATE embeddings SET ultimo_uso = ? WHERE clave = ?", [(ahora, c) for c in viejas])
+                    conn.commit()
+                except sqlite3.OperationalError as e:
+                    # Es solo una pista para la expulsión: un archivo bloqueado no convierte el acierto en fallo.
+                    conn.rollback()
+                    log(f"No se pudo refrescar el uso en la caché de embeddings: {e}", nivel="warning")
+        return encontrados
+
+    def guardar(self, pares):
+        """Guarda [(clave, vector)] y expulsa las entradas menos usadas si se supera el tope."""
+        if not pares:
+            return
+        ahora = time.time()
+        with self._lock:
+            conn = self._conexion()
+            conn.executemany("INSERT OR REPLACE INTO embeddings (clave, vector, ultimo_uso) VALUES (?, ?, ?)",
+                             [(c, array('f', v).tobytes(), ahora) for c, v in pares])
+            self._inserciones += len(pares)
+            # El conteo es caro; solo se revisa el tope cada cierto número de inserciones.
+            if self._inserciones >= 100:
+                self._inserciones = 0
+                sobrantes = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] - self.max_entradas
+                if sobrantes > 0:
+                    conn.execute("DELETE FROM embeddings WHERE clave IN "
+                                 "(SELECT clave FROM embeddings ORDER BY ultimo_uso LIMIT ?)", (sobrantes,))
+            conn.commit()
+
+cache_embeddings = CacheEmbeddings(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX)
+
+def obtener_embeddings(textos):
+    """Embeddings para una lista de textos, consultando primero la caché persistente."""
+    claves = [CacheEmbeddings.clave(EMBEDDING_MODEL, t) for t in textos]
+    try:
+        vectores = cache_embeddings.obtener(claves)
+    except sqlite3.Error as e:
+        log(f"Error al leer la caché de embeddings: {e}", nivel="error")
+        vectores = {}
+
+    pendientes = {}
+    for clave, texto in zip(claves, textos):
+        if clave not in vectores:
+            pendientes.setdefault(clave, normalizar_texto(texto))
+    CACHE_EMBEDDINGS.incrementar("acierto", len(claves) - len(pendientes))
+    CACHE_EMBEDDINGS.incrementar("fallo", len(pendientes))
+    claves_pendientes = list(pendientes)
+    for inicio in range(0, len(claves_pendientes), EMBEDDING_LOTE):
+        lote = claves_pendientes[inicio:inicio + EMBEDDING_LOTE]
+        res = cliente_openai.llamar(openai.Embedding.create, OPENAI_TIMEOUT_EMBEDDING,
+                                    input=[pendientes[c] for c in lote], engine=EMBEDDING_MODEL)
+        nuevos = list(zip(lote, (item['embedding'] for item in res['data'])))
+        vectores.update(nuevos)
+        try:
+            cache_embeddings.guardar(nuevos)
+        except sqlite3.Error as e:
+            log(f"Error al escribir en la caché de embeddings: {e}", nivel="error")
+    return [vectores[c] for c in claves]
+
+# --- MICRO-LOTES DE EMBEDDINGS DE PREGUNTAS ---
+# Las preguntas que llegan casi a la vez desde distintos hilos se embeben en una
+# sola llamada: el primer hilo hace de líder, espera unos milisegundos a que se
+# sumen otros y reparte los vectores a cada uno.
+EMBEDDING_LOTE_CONSULTAS = int(os.getenv("EMBEDDING_LOTE_CONSULTAS", "64"))
+EMBEDDING_ESPERA_MS = float(os.getenv("EMBEDDING_ESPERA_MS", "5"))
+
+class _SolicitudEmbedding:
+    __slots__ = ("texto", "vector", "error", "lider", "evento")
+
+    def __init__(self, texto):
+        self.texto = texto
+        self.vector = None
+        self.error = None
+        self.lider = False
+        self.evento = threading.Event()
+
+class LoteadorEmbeddings:
+    """Agrupa solicitudes concurrentes de embeddings sin hilos propios (seguro frente al fork)."""
+
+    def __init__(self, tam_lote, espera_max):
+        self.tam_lote = max(tam_lote, 1)
+        self.espera_max = espera_max
+        self._cond = threading.Condition()
+        self._pendientes = []
+        self._hay_lider = False
+
+    def embeber(self, texto):
+        solicitud = _SolicitudEmbedding(texto)
+        with self._cond:
+            self._pendientes.append(solicitud)
+            if not self._hay_lider:
+                self._hay_lider = True
+                solicitud.lider = True
+                solicitud.evento.set()
+            elif len(self._pendientes) >= self.tam_lote:
+                self._cond.notify()
+        while True:
+            solicitud.evento.wait()
+            if not solicitud.lider:
+                break
+            # Este hilo lidera un lote (que incluye su propia solicitud).
+            solicitud.lider = False
+            solicitud.evento.clear()
+            self._despachar()
+        if solicitud.error is not None:
+            raise solicitud.error
+        return solicitud.vector
+
+    def _despachar(self):
+        limite = time.monotonic() + self.espera_max
+        with self._cond:
+            while len(self._pendientes) < self.tam_lote:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                self._cond.wait(restante)
+            lote = self._pendientes[:self.tam_lote]
+            del self._pendientes[:self.tam_lote]
+            if self._pendientes:
+                # Lo que no cupo en el lote pasa a otro líder; este hilo sigue con su llamada.
+                siguiente = self._pendientes[0]
+                siguiente.lider = True
+                siguiente.evento.set()
+            else:
+                self._hay_lider = False
+        try:
+            for solicitud, vector in zip(lote, obtener_embeddings([s.texto for s in lote])):
+                solicitud.vector = vector
+        except Exception as e:
+            for solicitud in lote:
+                solicitud.error = e
+        for solicitud in lote:
+            solicitud.evento.set()
+
+loteador_embeddings = LoteadorEmbeddings(EMBEDDING_LOTE_CONSULTAS, EMBEDDING_ESPERA_MS / 1000)
+
+def embedding_consulta(texto):
+    """Embedding de una pregunta: la caché responde sin esperar; los fallos van en micro-lotes."""
+    clave = CacheEmbeddings.clave(EMBEDDING_MODEL, texto)
+    try:
+        vector = cache_embeddings.obtener([clave]).get(clave)
+    except sqlite3.Error as e:
+        log(f"Error al leer la caché de embeddings: {e}", nivel="error")
+        vector = None
+    if vector is None:
+        return loteador_embeddings.embeber(texto)
+    CACHE_EMBEDDINGS.incrementar("acierto")
+    return vector
+
+# --- CACHÉ SEMÁNTICA DE RESPUESTAS ---
+# En noches de debate miles de ciudadanos hacen casi la misma pregunta; si una
+# pregunta nueva es lo bastante parecida (similitud coseno) a una ya respondida
+# con la misma versión del documento, se reutiliza la respuesta sin llamar a GPT-4.
+# Las preguntas del camino solo léxico no tienen embedding: se buscan por su texto normalizado.
+ANSWER_CACHE_MAX = int(os.getenv("ANSWER_CACHE_MAX", "2000"))
+ANSWER_CACHE_SIMILITUD = float(os.getenv("ANSWER_CACHE_SIMILITUD", "0.97"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+
+class CacheRespuestas:
+    """Búfer circular de (embedding normalizado, respuesta, expiración) en memoria del worker.
+
+    Cada entrada también queda indexada por el texto normalizado de su pregunta
+    y conserva los IDs de los fragmentos usados, para la memoria de conversación.
+    """
 
-WhatsApp: +57 320 XXX XXXX (Envía tu pregunta o sugerencia).
+    def __init__(self, max_entradas, umbral, ttl):
+        self.max_entradas = max_entradas
+        self.umbral = umbral
+        self.ttl = ttl
+        self.version = None
+        self.aciertos = 0
+        self.fallos = 0
+        self._lock = threading.Lock()
+        self._matriz = None  # se reserva al guardar la primera respuesta, cuando se conoce la dimensión
+        self._expira = np.zeros(max(max_entradas, 0))
+        self._respuestas = [None] * max(max_entradas, 0)
+        self._textos = [None] * max(max_entradas, 0)
+        self._contextos = [()] * max(max_entradas, 0)
+        self._por_texto = {}  # texto normalizado -> posición en el búfer
+        self._pos = 0
+
+    @staticmethod
+    def _clave_texto(texto):
+        return normalizar_texto(texto).casefold()
+
+    @staticmethod
+    def _normalizar(vector):
+        v = np.asarray(vector, dtype=np.float32)
+        norma = np.linalg.norm(v)
+        return v / norma if norma else v
+
+    def invalidar(self, version):
+        """Descarta todas las respuestas si cambió la versión del documento."""
+        with self._lock:
+            if version != self.version:
+                self._expira[:] = 0
+                self._respuestas = [None] * len(self._respuestas)
+                self._textos = [None] * len(self._textos)
+                self._contextos = [()] * len(self._contextos)
+                self._por_texto = {}
+                self.version = version
+
+    def buscar(self, vector):
+        """Devuelve (respuesta, ids de contexto) o None."""
+        if self.max_entradas <= 0:
+            return None
+        q = self._normalizar(vector)
+        with self._lock:
+            if self._matriz is not None:
+                similitudes = self._matriz @ q
+                similitudes[self._expira <= time.time()] = -np.inf
+                i = int(np.argmax(similitudes))
+                if similitudes[i] >= self.umbral:
+                    self.aciertos += 1
+                    return self._respuestas[i], list(self._contextos[i])
+            self.fallos += 1
+            return None
+
+    def buscar_texto(self, texto):
+        """Coincidencia exacta por texto normalizado, sin embedding."""
+        if self.max_entradas <= 0:
+            return None
+        with self._lock:
+            i = self._por_texto.get(self._clave_texto(texto))
+            if i is not None and self._expira[i] > time.time():
+                self.aciertos += 1
+                return self._respuestas[i], list(self._contextos[i])
+            return None
+
+    def guardar(self, vector, respuesta, texto, ids_contexto):
+        """Guarda la respuesta; con `vector` None solo se encuentra por texto."""
+        if self.max_entradas <= 0:
+            return
+        q = None if vector is None else self._normalizar(vector)
+        clave = self._clave_texto(texto)
+        with self._lock:
+            if q is not None and self._matriz is None:
+                self._matriz = np.zeros((self.max_entradas, q.shape[0]), dtype=np.float32)
+            if self._matriz is not None:
+                # Una fila en cero no se parece a nada: la entrada solo se encuentra por texto.
+                self._matriz[self._pos] = 0 if q is None else q
+            anterior = self._textos[self._pos]
+            if anterior is not None and self._por_texto.get(anterior) == self._pos:
+                del self._por_texto[anterior]
+            self._expira[self._pos] = time.time() + self.ttl
+            self._respuestas[self._pos] = respuesta
+            self._textos[self._pos] = clave
+            self._contextos[self._pos] = tuple(ids_contexto)
+            self._por_texto[clave] = self._pos
+            self._pos = (self._pos + 1) % self.max_entradas
+
+cache_respuestas = CacheRespuestas(ANSWER_CACHE_MAX, ANSWER_CACHE_SIMILITUD, ANSWER_CACHE_TTL)
+
+# --- RECUPERADORES (BACKENDS DE BÚSQUEDA VECTORIAL) ---
+# "numpy" mantiene el índice en una matriz en memoria; "chroma" usa la colección persistente.
+RECUPERADOR = os.getenv("RECUPERADOR", "numpy")
+INDICE_NUMPY_PATH = os.getenv("INDICE_NUMPY_PATH", "./indice_numpy")
+
+class Recuperador:
+    """Interfaz común de los backends de búsqueda.
+
+    Las distancias son L2 al cuadrado entre vectores normalizados (la métrica
+    por defecto de Chroma), así que son comparables entre backends.
+    """
 
-Redes Sociales: @JavierMontoyaGobernador (Instagram y Facebook).
+    def ids(self):
+        raise NotImplementedError
 
-Correo Electrónico: contacto@javiermontoya.com
+    def eliminar(self, ids):
+        raise NotImplementedError
 
-Calendario de Eventos:
+    def agregar(self, ids, documentos, metadatos, embeddings):
+        raise NotImplementedError
 
-2 de septiembre: Encuentro ciudadano en el Parque Bolívar, Armenia.
+    def buscar(self, embedding, k):
+        """Devuelve [(id, documento, metadatos, distancia)] del más al menos cercano."""
+        raise NotImplementedError
 
-9 de septiembre: Recorrido por las fincas cafeteras de Génova.
+class RecuperadorChroma(Recuperador):
 
-15 de septiembre: Debate abierto con jóvenes en la Universidad del Quindío.
+    def ids(self):
+        return set(obtener_coleccion().get(include=[])['ids'])
 
-20 de septiembre: Encuentro con el sector turístico en Salento.
+    def eliminar(self, ids):
+        obtener_coleccion().delete(ids=list(ids))
 
-Tu apoyo, tu voz y tus ideas son cruciales. Con tu participación, construiremos el Quindío que merecemos.
+    def agregar(self, ids, documentos, metadatos, embeddings):
+        obtener_coleccion().add(embeddings=embeddings, documents=documentos, metadatas=metadatos, ids=ids)
 
+    def buscar(self, embedding, k):
+        res = obtener_coleccion().query(query_embeddings=[embedding], n_results=k)
+        metadatos = [m or {} for m in res['metadatas'][0]]
+        return list(zip(res['ids'][0], res['documents'][0], metadatos, res['distances'][0]))
 
+class RecuperadorNumpy(Recuperador):
+    """Matriz float32 contigua y normalizada, mapeada en memoria desde disco.
 
+    El top-k es un único producto matriz-vector más argpartition. El archivo se
+    abre con mmap de solo lectura, así que los workers forkeados comparten sus
+    páginas en lugar de tener cada uno su copia.
+    """
 
+    def __init__(self, directorio):
+        self.directorio = directorio
+        self._lock = threading.Lock()
+        self._matriz = None
+        self._ids = []
+        self._documentos = []
+        self._metadatos = []
+        self._cargado = False
+
+    def _ruta(self, nombre):
+        return os.path.join(self.directorio, nombre)
+
+    def _cargar(self):
+        if self._cargado:
+            return
+        # documentos.json se reemplaza después de vectores.npy, así que marca un índice completo.
+        if os.path.exists(self._ruta("documentos.json")):
+            with open(self._ruta("documentos.json"), encoding="utf-8") as f:
+                datos = json.load(f)
+            self._ids, self._documentos = datos["ids"], datos["documentos"]
+            self._metadatos = datos.get("metadatos", [{}] * len(self._ids))
+            # np.memmap no admite archivos sin datos.
+            self._matriz = np.load(self._ruta("vectores.npy"), mmap_mode="r") if self._ids else None
+        self._cargado = True
+
+    def _guardar(self, matriz, ids, documentos, metadatos):
+        # Se escribe a archivos temporales y se renombra; la indexación ya está
+        # serializada entre procesos por bloqueo_indexacion().
+        os.makedirs(self.directorio, exist_ok=True)
+        np.save(self._ruta("vectores.tmp.npy"), np.ascontiguousarray(matriz, dtype=np.float32))
+        with open(self._ruta("documentos.tmp.json"), "w", encoding="utf-8") as f:
+            json.dump({"ids": ids, "documentos": documentos, "metadatos": metadatos}, f, ensure_ascii=False)
+        os.replace(self._ruta("vectores.tmp.npy"), self._ruta("vectores.npy"))
+        os.replace(self._ruta("documentos.tmp.json"), self._ruta("documentos.json"))
+        self._cargado = False
+        self._cargar()
+
+    def ids(self):
+        with self._lock:
+            self._cargar()
+            return set(self._ids)
+
+    def eliminar(self, ids):
+        with self._lock:
+            self._cargar()
+            if self._matriz is None:
+                return
+            borrar = set(ids)
+            conservar = [i for i, id_ in enumerate(self._ids) if id_ not in borrar]
+            self._guardar(np.asarray(self._matriz)[conservar],
+                          [self._ids[i] for i in conservar],
+                          [self._documentos[i] for i in conservar],
+                          [self._metadatos[i] for i in conservar])
+
+    def agregar(self, ids, documentos, metadatos, embeddings):
+        nuevos = np.asarray(embeddings, dtype=np.float32)
+        normas = np.linalg.norm(nuevos, axis=1, keepdims=True)
+        nuevos /= np.where(normas == 0, 1, normas)
+        with self._lock:
+            self._cargar()
+            matriz = nuevos if self._matriz is None else np.vstack([self._matriz, nuevos])
+            self._guardar(matriz, self._ids + list(ids), self._documentos + list(documentos),
+                          self._metadatos + list(metadatos))
+
+    def buscar(self, embedding, k):
+        self._cargar()
+        matriz, ids, documentos, metadatos = self._matriz, self._ids, self._documentos, self._metadatos
+        if matriz is None or not ids:
+            return []
+        q = np.asarray(embedding, dtype=np.float32)
+        q = q / (np.linalg.norm(q) or 1)
+        similitudes = matriz @ q
+        k = min(k, len(ids))
+        top = np.argpartition(-similitudes, k - 1)[:k]
+        top = top[np.argsort(-similitudes[top])]
+        return [(ids[i], documentos[i], metadatos[i], float(2 - 2 * similitudes[i])) for i in top]
+
+RECUPERADORES = {
+    "chroma": RecuperadorChroma,
+    "numpy": lambda: RecuperadorNumpy(INDICE_NUMPY_PATH),
+}
+if RECUPERADOR not in RECUPERADORES:
+    raise ValueError(f"RECUPERADOR desconocido: {RECUPERADOR} (opciones: {', '.join(RECUPERADORES)})")
+_recuperador = None
+
+def recuperador():
+    global _recuperador
+    if _recuperador is None:
+        _recuperador = RECUPERADORES[RECUPERADOR]()
+    return _recuperador
+
+# --- ÍNDICE LÉXICO (BM25) Y RECUPERACIÓN HÍBRIDA ---
+# Los embeddings fallan con términos exactos (municipios, cifras, nombres de
+# programas). Un índice invertido BM25 sobre los mismos fragmentos se fusiona
+# con la búsqueda vectorial por rangos recíprocos (RRF); cuando la coincidencia
+# léxica es clara se responde solo con ella y no se pide el embedding.
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# Fracción del puntaje del mejor resultado léxico que debe tener un fragmento para contar.
+LEXICO_PUNTAJE_RELATIVO_MIN = float(os.getenv("LEXICO_PUNTAJE_RELATIVO_MIN", "0.5"))
+# Camino solo léxico: el mejor fragmento cubre casi todo el peso (IDF) de la
+# pregunta y le saca ventaja clara al segundo.
+LEXICO_COBERTURA_MIN = float(os.getenv("LEXICO_COBERTURA_MIN", "0.85"))
+LEXICO_MARGEN_MIN = float(os.getenv("LEXICO_MARGEN_MIN", "1.3"))
+LEXICO_SOLO = os.getenv("LEXICO_SOLO", "1") == "1"
+RRF_K = int(os.getenv("RRF_K", "60"))
+_PALABRAS_VACIAS = frozenset("""
+a al algo como con cual cuales cuando de del donde el ella ellas ellos en entre es esa ese eso esta este
+esto fue ha hay la las le les lo los mas me mi mis muy no nos o para pero por que quien se si sin sobre
+son su sus te tiene tu tus un una uno unos unas usted y ya yo
+""".split())
+
+def terminos(texto):
+    """Minúsculas, sin tildes ni palabras vacías: "Génova" y "genova" son el mismo término."""
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return [t for t in re.findall(r'\w+', texto) if t not in _PALABRAS_VACIAS]
+
+class IndiceLexico:
+    """Índice invertido BM25 en memoria del worker.
+
+    La ingesta lo construye junto al índice vectorial y lo guarda como JSON
+    (postings ya calculados); cada proceso lo carga al abrir el índice.
+    """
 
+    def __init__(self):
+        self._ids, self._documentos, self._metadatos, self._longitudes = [], [], [], []
+        self._postings = {}  # término -> [(posición del fragmento, frecuencia)]
+        self._posiciones = {}  # id -> posición del fragmento
+        self._idf = {}
+        self._longitud_media = 0
+
+    @property
+    def cargado(self):
+        return bool(self._ids)
+
+    @staticmethod
+    def construir(ruta, ids, documentos, metadatos):
+        postings, longitudes = {}, []
+        for posicion, documento in enumerate(documentos):
+            frecuencias = {}
+            for termino in terminos(documento):
+                frecuencias[termino] = frecuencias.get(termino, 0) + 1
+            longitudes.append(sum(frecuencias.values()))
+            for termino, frecuencia in frecuencias.items():
+                postings.setdefault(termino, []).append([posicion, frecuencia])
+        temporal = ruta + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump({"ids": ids, "documentos": documentos, "metadatos": metadatos,
+                       "longitudes": longitudes, "postings": postings}, f, ensure_ascii=False)
+        os.replace(temporal, ruta)
+
+    def cargar(self, ruta):
+        with open(ruta, encoding="utf-8") as f:
+            datos = json.load(f)
+        total = len(datos["ids"])
+        self._idf = {t: math.log(1 + (total - len(p) + 0.5) / (len(p) + 0.5)) for t, p in datos["postings"].items()}
+        self._postings = {t: [tuple(x) for x in p] for t, p in datos["postings"].items()}
+        self._longitudes = datos["longitudes"]
+        self._longitud_media = sum(self._longitudes) / (total or 1)
+        self._ids, self._documentos, self._metadatos = datos["ids"], datos["documentos"], datos["metadatos"]
+        self._posiciones = {id_: posicion for posicion, id_ in enumerate(self._ids)}
+
+    def posiciones(self, ids):
+        """Forma compacta de una lista de IDs (4 bytes por fragmento), para guardar en sesiones."""
+        return array('I', (self._posiciones[i] for i in ids if i in self._posiciones))
+
+    def fragmentos(self, posiciones):
+        """[(id, documento, metadatos, None)] de las posiciones dadas, sin buscar de nuevo."""
+        return [(self._ids[p], self._documentos[p], self._metadatos[p], None) for p in posiciones if p < len(self._ids)]
+
+    def buscar(self, consulta, k):
+        """Devuelve ([(id, documento, metadatos, puntaje)], cobertura del mejor resultado)."""
+        consulta = set(terminos(consulta))
+        if not consulta or not self._ids:
+            return [], 0.0
+        puntajes, pesos = {}, {}
+        for termino in consulta:
+            for posicion, frecuencia in self._postings.get(termino, ()):
+                normalizacion = BM25_K1 * (1 - BM25_B + BM25_B * self._longitudes[posicion] / self._longitud_media)
+                puntajes[posicion] = puntajes.get(posicion, 0.0) + self._idf[termino] * frecuencia * (BM25_K1 + 1) / (frecuencia + normalizacion)
+                pesos.setdefault(posicion, set()).add(termino)
+        if not puntajes:
+            return [], 0.0
+        mejores = sorted(puntajes, key=puntajes.get, reverse=True)[:k]
+        minimo = puntajes[mejores[0]] * LEXICO_PUNTAJE_RELATIVO_MIN
+        resultados = [(self._ids[p], self._documentos[p], self._metadatos[p], puntajes[p]) for p in mejores if puntajes[p] >= minimo]
+        # Un término desconocido pesa como el más raro del corpus: la pregunta trae algo que el índice no cubre.
+        idf_max = max(self._idf.values())
+        peso_consulta = sum(self._idf.get(t, idf_max) for t in consulta)
+        cobertura = sum(self._idf[t] for t in pesos[mejores[0]]) / peso_consulta
+        return resultados, cobertura
+
+indice_lexico = IndiceLexico()
+
+def lexico_concluyente(resultados, cobertura):
+    if not LEXICO_SOLO or not resultados or cobertura < LEXICO_COBERTURA_MIN:
+        return False
+    return len(resultados) == 1 or resultados[0][3] >= LEXICO_MARGEN_MIN * resultados[1][3]
+
+def fusionar_rrf(vectoriales, lexicos, k):
+    """Fusión por rangos recíprocos. Solo los fragmentos que encontró únicamente la
+    búsqueda vectorial conservan su distancia; los que tienen apoyo léxico quedan en
+    None, para que el filtro de distancia del contexto no los descarte."""
+    puntajes, filas = {}, {}
+    for lista, es_vectorial in ((vectoriales, True), (lexicos, False)):
+        for rango, (id_, documento, metadatos, valor) in enumerate(lista):
+            puntajes[id_] = puntajes.get(id_, 0.0) + 1 / (RRF_K + rango + 1)
+            distancia = valor if es_vectorial else None
+            filas[id_] = (id_, documento, metadatos, distancia)
+    return [filas[i] for i in sorted(puntajes, key=puntajes.get, reverse=True)[:k]]
+
+# --- PREGUNTAS FRECUENTES: RESPUESTA DIRECTA SIN GPT-4 ---
+# Los pares "Pregunta: ... Respuesta: ..." del corpus se extraen en la ingesta.
+# Si el mensaje coincide con una de esas preguntas, se responde con la
+# respuesta guardada: milisegundos y ningún costo de completion. El webhook solo
+# hace la comparación por términos (sin red); la comparación por embedding se
+# hace dentro del pipeline, cuando de todos modos se calcula el embedding.
+FAQ_SIMILITUD = float(os.getenv("FAQ_SIMILITUD", "0.93"))
+# Coincidencia casi literal (Jaccard de términos): ni siquiera hace falta el embedding.
+FAQ_COINCIDENCIA_LEXICA = float(os.getenv("FAQ_COINCIDENCIA_LEXICA", "0.8"))
+FAQ_PREGENERAR = os.getenv("FAQ_PREGENERAR", "0") == "1"
+# Una pregunta con menos términos de contenido ("¿Qué haremos?") coincide con demasiados mensajes.
+FAQ_TERMINOS_MIN = int(os.getenv("FAQ_TERMINOS_MIN", "3"))
+
+def separar_pregunta_respuesta(fragmento):
+    """(pregunta, respuesta) de un fragmento de tipo pregunta_respuesta, sin el encabezado."""
+    cuerpo = fragmento.split("\n", 1)[1] if "\n" in fragmento else fragmento
+    par = _PREGUNTA_RESPUESTA.match(cuerpo)
+    if par:
+        return par.group("pregunta"), par.group("respuesta")
+    pregunta, _, respuesta = cuerpo.partition("\n")
+    if not pregunta.endswith("?") or not respuesta.strip():
+        return None
+    return pregunta, respuesta.strip()
+
+def pregenerar_respuesta(pregunta, respuesta):
+    """Reescribe la respuesta del documento en la voz del candidato, sin agregar datos."""
+    prompt = f"""
+    Eres Javier Montoya, candidato a la gobernación del Quindío. Reescribe la siguiente respuesta en primera persona, con tono cercano y directo, para enviarla por WhatsApp.
+    Conserva todas las cifras, nombres de programas y compromisos, y no agregues nada que no esté en el texto.
+    Pregunta: "{pregunta}"
+    Respuesta: "{respuesta}"
     """
-    text_chunks = re.split(r'(?<=[.?!])\s+', campaign_document.replace('\n', ' ').replace('•', '').replace('¿', '').replace('¡', ''))
-    text_chunks = [chunk.strip() for chunk in text_chunks if len(chunk.strip()) > 15]
-
-    # La lógica de recarga solo se ejecuta si es absolutamente necesario
-    if collection.count() != len(text_chunks):
-        print(f"Base de datos desincronizada (DB: {collection.count()}, DOC: {len(text_chunks)}). Recargando...")
-        if collection.count() > 0:
-            ids_to_delete = [f"doc_chunk_{i}" for i in range(collection.count())]
-            if ids_to_delete: collection.delete(ids=ids_to_delete)
-        
-        res = openai.Embedding.create(input=text_chunks, engine="text-embedding-ada-002")
-        embeddings_list = [item['embedding'] for item in res['data']]
-        doc_ids = [f"doc_chunk_{i}" for i in range(len(text_chunks))]
-        collection.add(embeddings=embeddings_list, documents=text_chunks, ids=doc_ids)
-        print("¡Cerebro recargado!")
+    res = cliente_openai.llamar(openai.ChatCompletion.create, OPENAI_TIMEOUT_CHAT, model="gpt-4",
+                                messages=[{"role": "user", "content": prompt}], temperature=0.2)
+    return res['choices'][0]['message']['content'].strip()
+
+class IndicePreguntas:
+    """Preguntas frecuentes con su embedding normalizado y su respuesta lista para enviar."""
+
+    def __init__(self, umbral, umbral_lexico):
+        self.umbral, self.umbral_lexico = umbral, umbral_lexico
+        self._matriz = None
+        self._terminos = []
+        self._respuestas = []
+        self._ids = []
+
+    @staticmethod
+    def construir(ruta, fragmentos, pregenerar=False):
+        """Extrae los pares de los fragmentos ({id: (texto, metadatos)}) y los guarda en `ruta`.
+
+        Las respuestas pregeneradas de una ingesta anterior se reutilizan por ID de fragmento.
+        """
+        anteriores = {}
+        if pregenerar and os.path.exists(ruta):
+            with open(ruta, encoding="utf-8") as f:
+                anteriores = {e["id"]: e for e in json.load(f) if e.get("pregenerada")}
+        pares = []
+        for id_, (texto, metadatos) in sorted(fragmentos.items()):
+            par = separar_pregunta_respuesta(texto) if metadatos["tipo"] == "pregunta_respuesta" else None
+            # Una respuesta que es una lista de rótulos no se envía tal cual; la pregunta
+            # seguida de una lista ya queda como texto al fragmentar.
+            if par and len(terminos(par[0])) >= FAQ_TERMINOS_MIN and not _es_lista(par[1].splitlines()):
+                pares.append((id_, par))
+        # Una pregunta repetida en el corpus no tiene una única respuesta: se descarta.
+        repeticiones = {}
+        for _, (pregunta, _) in pares:
+            clave = " ".join(terminos(pregunta))
+            repeticiones[clave] = repeticiones.get(clave, 0) + 1
+        entradas = [{"id": id_, "pregunta": pregunta, "respuesta": respuesta, "pregenerada": False}
+                    for id_, (pregunta, respuesta) in pares if repeticiones[" ".join(terminos(pregunta))] == 1]
+        for entrada, vector in zip(entradas, obtener_embeddings([e["pregunta"] for e in entradas])):
+            entrada["embedding"] = vector
+            if entrada["id"] in anteriores:
+                entrada["respuesta"], entrada["pregenerada"] = anteriores[entrada["id"]]["respuesta"], True
+            elif pregenerar:
+                entrada["respuesta"], entrada["pregenerada"] = pregenerar_respuesta(entrada["pregunta"], entrada["respuesta"]), True
+        temporal = ruta + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(entradas, f, ensure_ascii=False)
+        os.replace(temporal, ruta)
+        return len(entradas)
+
+    def cargar(self, ruta):
+        with open(ruta, encoding="utf-8") as f:
+            entradas = json.load(f)
+        if entradas:
+            matriz = np.asarray([e["embedding"] for e in entradas], dtype=np.float32)
+            normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+            self._matriz = matriz / np.where(normas == 0, 1, normas)
+        else:
+            self._matriz = None
+        self._terminos = [set(terminos(e["pregunta"])) for e in entradas]
+        self._respuestas = [e["respuesta"] for e in entradas]
+        self._ids = [e["id"] for e in entradas]
+
+    def buscar_texto(self, mensaje):
+        """(respuesta, id del fragmento) si el mensaje es casi literal a una pregunta frecuente, o None."""
+        consulta = set(terminos(mensaje))
+        if not consulta:
+            return None
+        for i, otros in enumerate(self._terminos):
+            if len(consulta & otros) / len(consulta | otros) >= self.umbral_lexico:
+                return self._respuestas[i], self._ids[i]
+        return None
+
+    def buscar_vector(self, embedding):
+        """(respuesta, id del fragmento) de la pregunta frecuente más parecida al embedding, o None."""
+        if self._matriz is None:
+            return None
+        q = np.asarray(embedding, dtype=np.float32)
+        similitudes = self._matriz @ (q / (np.linalg.norm(q) or 1))
+        i = int(np.argmax(similitudes))
+        return (self._respuestas[i], self._ids[i]) if similitudes[i] >= self.umbral else None
+
+indice_preguntas = IndicePreguntas(FAQ_SIMILITUD, FAQ_COINCIDENCIA_LEXICA)
+
+def responder_faq(mensaje):
+    """(respuesta, id del fragmento) si el mensaje es una pregunta frecuente casi literal, o None.
+
+    Solo compara términos: no hace llamadas de red, así que cabe en el webhook.
+    """
+    with medir("faq"):
+        coincidencia = indice_preguntas.buscar_texto(mensaje)
+    if coincidencia is not None:
+        FAQ.incrementar("acierto")
+    return coincidencia
+
+# --- BASE DE CONOCIMIENTO E INGESTA ---
+# El corpus vive en un directorio de archivos (.md, .txt, .jsonl). La ingesta
+# (`flask --app api ingestar`) fragmenta, embebe en lotes paralelos y escribe el
+# índice junto con un manifiesto; la API solo abre ese índice ya construido.
+CONOCIMIENTO_PATH = os.getenv("CONOCIMIENTO_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "conocimiento"))
+MANIFIESTO_PATH = os.getenv("MANIFIESTO_PATH", os.path.join(CHROMA_PATH if RECUPERADOR == "chroma" else INDICE_NUMPY_PATH, "manifiesto.json"))
+# Solo para desarrollo local: sin manifiesto, el primer proceso construye el índice al
+# arrancar. En producción la API se niega a arrancar hasta que se ejecute la ingesta.
+INDEXAR_AL_INICIAR = os.getenv("INDEXAR_AL_INICIAR", "0") == "1"
+INGESTA_HILOS = int(os.getenv("INGESTA_HILOS", "4"))
+INDICE_LOTE_ESCRITURA = int(os.getenv("INDICE_LOTE_ESCRITURA", "5000"))
+LEXICO_PATH = os.getenv("LEXICO_PATH", os.path.join(os.path.dirname(MANIFIESTO_PATH), "lexico.json"))
+FAQ_PATH = os.getenv("FAQ_PATH", os.path.join(os.path.dirname(MANIFIESTO_PATH), "faq.json"))
+EXTENSIONES_CORPUS = (".md", ".txt", ".jsonl")
+
+def leer_corpus(directorio):
+    """Devuelve [(fuente, texto)] con un documento por archivo (o por línea en .jsonl).
+
+    Cada línea JSONL es un objeto con "texto" y, opcionalmente, "titulo" y "fuente".
+    """
+    documentos = []
+    for nombre in sorted(os.listdir(directorio)):
+        ruta = os.path.join(directorio, nombre)
+        if not os.path.isfile(ruta) or not nombre.endswith(EXTENSIONES_CORPUS):
+            continue
+        with open(ruta, encoding="utf-8") as f:
+            if not nombre.endswith(".jsonl"):
+                documentos.append((nombre, f.read()))
+                continue
+            for numero, linea in enumerate(f, 1):
+                if not linea.strip():
+                    continue
+                registro = json.loads(linea)
+                titulo = registro.get("titulo") or os.path.splitext(nombre)[0]
+                documentos.append((registro.get("fuente") or f"{nombre}:{numero}", f"{titulo}\n{registro['texto']}"))
+    return documentos
+
+@contextmanager
+def bloqueo_indexacion():
+    """Serializa la indexación entre procesos (workers, ingesta manual)."""
+    directorio = os.path.dirname(os.path.abspath(MANIFIESTO_PATH))
+    os.makedirs(directorio, exist_ok=True)
+    with open(os.path.join(directorio, ".indexacion.lock"), "w") as archivo_lock:
+        if fcntl is not None:
+            fcntl.flock(archivo_lock, fcntl.LOCK_EX)
+        yield
+
+def ingestar_corpus(directorio=CONOCIMIENTO_PATH, hilos=INGESTA_HILOS, pregenerar_faq=FAQ_PREGENERAR):
+    """Sincroniza el índice con el corpus y escribe el manifiesto. Llamar con bloqueo_indexacion()."""
+    log("Iniciando ingesta del corpus...", directorio=directorio)
+    # Indexación incremental: cada fragmento se identifica por el hash de su
+    # contenido, así que solo se embeben los fragmentos nuevos o editados y solo
+    # se borran los que ya no existen en el corpus.
+    documentos = leer_corpus(directorio)
+    fragmentos = {}
+    for fuente, texto_documento in documentos:
+        for texto, metadatos in fragmentar_documento(texto_documento):
+            fragmentos.setdefault(id_fragmento(texto), (texto, dict(metadatos, fuente=fuente)))
+
+    indice = recuperador()
+    ids_en_disco = indice.ids()
+    ids_obsoletos = [i for i in ids_en_disco if i not in fragmentos]
+    ids_nuevos = [i for i in fragmentos if i not in ids_en_disco]
+
+    # Primero se embebe todo: si OpenAI falla a mitad de camino, el índice queda intacto.
+    lotes = [ids_nuevos[i:i + EMBEDDING_LOTE] for i in range(0, len(ids_nuevos), EMBEDDING_LOTE)]
+    with ThreadPoolExecutor(max_workers=max(hilos, 1)) as pool:
+        vectores = pool.map(lambda lote: obtener_embeddings([fragmentos[i][0] for i in lote]), lotes)
+        embeddings_nuevos = [vector for vectores_lote in vectores for vector in vectores_lote]
+
+    # Mientras se escriben los índices no hay manifiesto: si algo falla desde aquí, la
+    # API no abre un índice a medias y la próxima ingesta lo completa. Las preguntas
+    # frecuentes (que también llaman a OpenAI) van antes que el índice vectorial.
+    if os.path.exists(MANIFIESTO_PATH):
+        os.remove(MANIFIESTO_PATH)
+    preguntas = IndicePreguntas.construir(FAQ_PATH, fragmentos, pregenerar_faq)
+    if ids_obsoletos:
+        indice.eliminar(ids_obsoletos)
+    for inicio in range(0, len(ids_nuevos), INDICE_LOTE_ESCRITURA):
+        lote_ids = ids_nuevos[inicio:inicio + INDICE_LOTE_ESCRITURA]
+        indice.agregar(lote_ids, [fragmentos[i][0] for i in lote_ids], [fragmentos[i][1] for i in lote_ids],
+                       embeddings_nuevos[inicio:inicio + INDICE_LOTE_ESCRITURA])
+
+    # El índice léxico es barato: se reconstruye entero en cada ingesta.
+    ids_ordenados = sorted(fragmentos)
+    IndiceLexico.construir(LEXICO_PATH, ids_ordenados, [fragmentos[i][0] for i in ids_ordenados],
+                           [fragmentos[i][1] for i in ids_ordenados])
+
+    # La versión del corpus es el conjunto de fragmentos; al cambiar, las
+    # respuestas cacheadas dejan de ser válidas.
+    manifiesto = {
+        "version": hashlib.sha256("".join(sorted(fragmentos)).encode("utf-8")).hexdigest()[:16],
+        "fragmentos": len(fragmentos),
+        "fuentes": [fuente for fuente, _ in documentos],
+        "recuperador": RECUPERADOR,
+        "generado": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+    temporal = MANIFIESTO_PATH + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(manifiesto, f, ensure_ascii=False, indent=2)
+    os.replace(temporal, MANIFIESTO_PATH)
+    log(f"Ingesta completa: {len(ids_nuevos)} fragmentos nuevos, {len(ids_obsoletos)} eliminados, "
+        f"{len(fragmentos) - len(ids_nuevos)} sin cambios.", version=manifiesto["version"], documentos=len(documentos),
+        preguntas_frecuentes=preguntas)
+    return manifiesto
+
+@app.cli.command("ingestar")
+@click.option("--directorio", default=CONOCIMIENTO_PATH, show_default=True, help="Directorio con archivos .md, .txt o .jsonl.")
+@click.option("--hilos", default=INGESTA_HILOS, show_default=True, help="Lotes de embeddings en paralelo.")
+@click.option("--pregenerar-faq/--sin-pregenerar-faq", default=FAQ_PREGENERAR, show_default=True,
+              help="Reescribe con GPT-4 las respuestas frecuentes en primera persona.")
+def ingestar_comando(directorio, hilos, pregenerar_faq):
+    """Construye o actualiza el índice a partir del corpus, antes de desplegar la API."""
+    with bloqueo_indexacion():
+        ingestar_corpus(directorio, hilos, pregenerar_faq)
+
+# --- ESTADO DEL CEREBRO ---
+# PID del proceso que ya abrió el índice; tras un fork el worker lo vuelve a abrir.
+_cerebro = {"pid": None}
+_cerebro_lock = threading.Lock()
+VERSION_DOCUMENTO = None
+
+def cerebro_listo():
+    return _cerebro["pid"] == os.getpid()
+
+def asegurar_cerebro():
+    """Abre el índice una sola vez por proceso; las llamadas concurrentes esperan a la primera."""
+    if cerebro_listo():
+        return
+    with _cerebro_lock:
+        if cerebro_listo():
+            return
+        with medir("indexacion"):
+            if not os.path.exists(MANIFIESTO_PATH):
+                if not INDEXAR_AL_INICIAR:
+                    raise RuntimeError(f"No hay índice en {MANIFIESTO_PATH}; ejecuta `flask --app api ingestar`.")
+                with bloqueo_indexacion():
+                    # Otro proceso pudo construirlo mientras esperábamos el bloqueo.
+                    if not os.path.exists(MANIFIESTO_PATH):
+                        ingestar_corpus()
+            abrir_indice()
+        _cerebro["pid"] = os.getpid()
+
+def abrir_indice():
+    """Abre el índice prebuilt en modo lectura: sin fragmentar ni embeber nada."""
+    global VERSION_DOCUMENTO
+    with open(MANIFIESTO_PATH, encoding="utf-8") as f:
+        manifiesto = json.load(f)
+    total = len(recuperador().ids())
+    if os.path.exists(LEXICO_PATH):
+        indice_lexico.cargar(LEXICO_PATH)
     else:
-        print("El cerebro ya está cargado y sincronizado en el disco.")
-        
-    CEREBRO_CARGADO = True
-    print("Verificación completa. El cerebro está listo.")
+        log(f"No hay índice léxico en {LEXICO_PATH}; solo búsqueda vectorial hasta la próxima ingesta.", nivel="warning")
+    if os.path.exists(FAQ_PATH):
+        indice_preguntas.cargar(FAQ_PATH)
+    cache_respuestas.invalidar(manifiesto["version"])
+    VERSION_DOCUMENTO = manifiesto["version"]
+    log("Índice abierto. El cerebro está listo.", version=VERSION_DOCUMENTO, fragmentos=total)
+
+# --- ARMADO DEL CONTEXTO ---
+# Solo entra al prompt lo relevante y no repetido, hasta un presupuesto de
+# tokens: los tokens del prompt determinan la latencia y el costo de GPT-4.
+RECUPERACION_K = int(os.getenv("RECUPERACION_K", "10"))
+CONTEXTO_DISTANCIA_MAX = float(os.getenv("CONTEXTO_DISTANCIA_MAX", "0.6"))
+CONTEXTO_TOKENS_MAX = int(os.getenv("CONTEXTO_TOKENS_MAX", "1200"))
+CONTEXTO_SIMILITUD_DUPLICADO = float(os.getenv("CONTEXTO_SIMILITUD_DUPLICADO", "0.8"))
+
+def _palabras(texto):
+    return set(re.findall(r'\w+', texto.lower()))
+
+def construir_contexto(resultados, tokens_max=CONTEXTO_TOKENS_MAX):
+    """Selecciona fragmentos por relevancia, sin casi-duplicados y dentro del presupuesto.
+
+    `resultados` viene ordenado del más al menos relevante; la distancia es None
+    en los fragmentos que encontró la búsqueda léxica.
+    Devuelve (contexto, ids_usados, tokens_contexto).
+    """
+    elegidos, palabras_elegidos, ids, tokens = [], [], [], 0
+    for id_, documento, _, distancia in resultados:
+        if distancia is not None and distancia > CONTEXTO_DISTANCIA_MAX:
+            continue
+        palabras = _palabras(documento)
+        if any(len(palabras & otras) / (len(palabras | otras) or 1) >= CONTEXTO_SIMILITUD_DUPLICADO
+               for otras in palabras_elegidos):
+            continue
+        tokens_documento = contar_tokens(documento) + 1
+        if tokens + tokens_documento > tokens_max:
+            continue
+        elegidos.append(documento)
+        palabras_elegidos.append(palabras)
+        ids.append(id_)
+        tokens += tokens_documento
+    return "\n\n".join(elegidos), ids, tokens
+
+# --- MEMORIA DE CONVERSACIÓN POR REMITENTE ---
+# "¿Y cuánto cuesta eso?" no se entiende solo. Por remitente se guardan los
+# últimos turnos en forma compacta (la pregunta recortada y las posiciones de
+# los fragmentos usados); una pregunta de seguimiento se reescribe como
+# consulta autónoma y reutiliza esos fragmentos, completados con la búsqueda
+# léxica, sin volver a calcular un embedding. Solo si el turno anterior no dejó
+# fragmentos se busca como una pregunta nueva.
+SESION_TURNOS = int(os.getenv("SESION_TURNOS", "3"))
+SESION_TTL = float(os.getenv("SESION_TTL", "1800"))
+SESIONES_MAX = int(os.getenv("SESIONES_MAX", "50000"))
+SESION_PREGUNTA_MAX_CARACTERES = int(os.getenv("SESION_PREGUNTA_MAX_CARACTERES", "200"))
+_CONECTORES_SEGUIMIENTO = frozenset({"y", "pero", "entonces", "tambien", "ademas", "o"})
+# Solo pronombres que no chocan con verbos ni determinantes comunes al quitar
+# las tildes ("esta" es también "está"; "este" o "ese" acompañan a un sustantivo).
+_REFERENCIAS_SEGUIMIENTO = frozenset({"eso", "esto", "aquello", "ahi", "alli"})
+
+def es_seguimiento(pregunta):
+    """Heurística barata: empieza con un conector o se refiere a algo dicho antes."""
+    texto = unicodedata.normalize("NFKD", pregunta.lower())
+    palabras = re.findall(r'\w+', "".join(c for c in texto if not unicodedata.combining(c)))
+    if not palabras:
+        return False
+    return palabras[0] in _CONECTORES_SEGUIMIENTO or not _REFERENCIAS_SEGUIMIENTO.isdisjoint(palabras)
+
+class Turno:
+    __slots__ = ("pregunta", "posiciones")
+
+    def __init__(self, pregunta, posiciones):
+        self.pregunta, self.posiciones = pregunta, posiciones
+
+class SesionesConversacion:
+    """LRU acotado de sesiones con expiración; cada sesión ocupa menos de 1 KB."""
+
+    def __init__(self, turnos, ttl, max_sesiones):
+        self.turnos_max, self.ttl, self.max_sesiones = turnos, ttl, max_sesiones
+        self._lock = threading.Lock()
+        self._sesiones = OrderedDict()  # remitente -> (expiración, tupla de Turno), la menos reciente primero
+
+    def __len__(self):
+        return len(self._sesiones)
+
+    def _purgar(self, ahora):
+        while self._sesiones:
+            expira, _ = next(iter(self._sesiones.values()))
+            if expira > ahora and len(self._sesiones) <= self.max_sesiones:
+                break
+            self._sesiones.popitem(last=False)
+
+    def turnos(self, remitente):
+        """Turnos vigentes del remitente, del más antiguo al más reciente."""
+        if not remitente or self.max_sesiones <= 0:
+            return []
+        with self._lock:
+            sesion = self._sesiones.get(remitente)
+            if sesion is None or sesion[0] <= time.time():
+                return []
+            return list(sesion[1])
+
+    def registrar(self, remitente, pregunta, ids):
+        if not remitente or self.max_sesiones <= 0:
+            return
+        turno = Turno(pregunta[:SESION_PREGUNTA_MAX_CARACTERES], indice_lexico.posiciones(ids))
+        ahora = time.time()
+        with self._lock:
+            _, turnos = self._sesiones.pop(remitente, (None, ()))
+            turnos = (turnos + (turno,))[-self.turnos_max:]
+            # Las sesiones quedan ordenadas por expiración: basta purgar desde el principio.
+            self._sesiones[remitente] = (ahora + self.ttl, turnos)
+            self._purgar(ahora)
+
+sesiones = SesionesConversacion(SESION_TURNOS, SESION_TTL, SESIONES_MAX)
+METRICAS.append(Indicador("candidato_sesiones_activas", "Sesiones de conversación en memoria del worker.",
+                          lambda: len(sesiones)))
+
+# --- ENTREGA POR PARTES ---
+# WhatsApp limita cada mensaje; además, con streaming la primera oración
+# completa puede enviarse mientras GPT-4 sigue escribiendo el resto.
+OPENAI_STREAMING = os.getenv("OPENAI_STREAMING", "1") == "1"
+WHATSAPP_MAX_CARACTERES = int(os.getenv("WHATSAPP_MAX_CARACTERES", "1600"))
+_FIN_ORACION = re.compile(r'[.?!](?=\s)')
+
+def dividir_mensaje(texto, limite=WHATSAPP_MAX_CARACTERES):
+    """Parte un texto en mensajes de hasta `limite` caracteres, cortando entre oraciones."""
+    mensajes, actual = [], ""
+    piezas = re.split(r'(?<=[.?!])(\s+)', texto.strip())
+    for separador, oracion in zip([""] + piezas[1::2], piezas[0::2]):
+        if len(actual) + len(separador) + len(oracion) <= limite:
+            actual += separador + oracion
+            continue
+        if actual:
+            mensajes.append(actual)
+        # Una sola oración más larga que el límite se corta en el último espacio posible.
+        while len(oracion) > limite:
+            corte = oracion.rfind(" ", 0, limite)
+            corte = corte if corte > 0 else limite
+            mensajes.append(oracion[:corte])
+            oracion = oracion[corte:].lstrip()
+        actual = oracion
+    if actual:
+        mensajes.append(actual)
+    return mensajes
+
+class EntregaParcial:
+    """Acumula el texto que llega en streaming y lo entrega en mensajes.
+
+    La primera entrega sale en cuanto hay al menos una oración completa; las
+    siguientes se agrupan hasta llenar un mensaje de WhatsApp.
+    """
 
-def ask_candidato_ia(pregunta):
-    contexto = ""
+    def __init__(self, entregar, limite=WHATSAPP_MAX_CARACTERES):
+        self._entregar = entregar
+        self.limite = limite
+        self.texto = ""
+        self._enviado = 0  # caracteres de self.texto ya entregados
+
+    def agregar(self, delta):
+        self.texto += delta
+        pendiente = self.texto[self._enviado:]
+        fines = [m.end() for m in _FIN_ORACION.finditer(pendiente)]
+        if not fines:
+            return
+        if self._enviado == 0 or len(pendiente) >= self.limite:
+            if self._enviado == 0:
+                observar_desde_inicio("primera_entrega")
+            corte = max(f for f in fines if f <= self.limite) if fines[0] <= self.limite else fines[0]
+            for mensaje in dividir_mensaje(pendiente[:corte], self.limite):
+                self._entregar(mensaje)
+            self._enviado += corte
+
+    def cerrar(self, respuesta):
+        """Entrega lo que falte; sin streaming (caché, error) entrega `respuesta` completa."""
+        restante = self.texto[self._enviado:] if self.texto else respuesta
+        if self._enviado == 0:
+            observar_desde_inicio("primera_entrega")
+        for mensaje in dividir_mensaje(restante, self.limite):
+            self._entregar(mensaje)
+        self._enviado = len(self.texto)
+
+def ask_candidato_ia(pregunta, entregar=None, remitente=None):
+    """Responde la pregunta y devuelve el texto completo.
+
+    Si se pasa `entregar`, la respuesta también se envía por partes con esa
+    función, a medida que GPT-4 produce oraciones completas. Con `remitente`,
+    la pregunta se interpreta dentro de su conversación reciente.
+    """
+    turnos = sesiones.turnos(remitente)
+    consulta, previos, antecedentes = pregunta, [], []
+    if turnos and es_seguimiento(pregunta):
+        # Consulta autónoma para la búsqueda: las preguntas anteriores desde la última
+        # que se entendía sola, más el seguimiento.
+        cadena = [pregunta]
+        for turno in reversed(turnos):
+            cadena.insert(0, turno.pregunta)
+            if not es_seguimiento(turno.pregunta):
+                break
+        consulta = " ".join(cadena)
+        previos = indice_lexico.fragmentos(turnos[-1].posiciones)
+        antecedentes = [t.pregunta for t in turnos]
+        log("Pregunta de seguimiento.", consulta=consulta, fragmentos_previos=len(previos))
+    entrega = EntregaParcial(entregar) if entregar else None
+    respuesta, ids_contexto = _generar_respuesta(pregunta, entrega, consulta, previos, antecedentes)
+    if entrega:
+        entrega.cerrar(respuesta)
+    sesiones.registrar(remitente, pregunta, ids_contexto)
+    return respuesta
+
+def _antecedentes_prompt(antecedentes):
+    if not antecedentes:
+        return ""
+    lineas = "\n".join(f'    - "{a}"' for a in antecedentes)
+    return f"Preguntas anteriores del mismo ciudadano (para entender a qué se refiere):\n{lineas}\n    "
+
+def _generar_respuesta(pregunta, entrega, consulta, previos, antecedentes):
+    """Devuelve (respuesta, ids de los fragmentos usados como contexto)."""
+    contexto, ids_contexto = "", []
+    query_embedding = None
     try:
-        res_query = openai.Embedding.create(input=[pregunta], engine="text-embedding-ada-002")
-        query_embedding = res_query['data'][0]['embedding']
-        
-        results = collection.query(query_embeddings=[query_embedding], n_results=10)
-        contexto = "\n\n".join(results['documents'][0])
+        with medir("lexico"):
+            lexicos, cobertura = indice_lexico.buscar(consulta, RECUPERACION_K)
+        # La respuesta a un seguimiento depende de la conversación: no sale de las
+        # preguntas frecuentes ni de la caché, ni se guarda en ella (aunque el turno
+        # anterior no haya dejado fragmentos).
+        reutilizable = not antecedentes
+        if previos:
+            # Seguimiento: los fragmentos del turno anterior, fusionados por rangos con los
+            # aciertos léxicos de la consulta autónoma. La consulta concatenada nunca está en
+            # la caché de embeddings, así que aquí no se busca por vector.
+            resultados = fusionar_rrf(previos, lexicos, RECUPERACION_K)
+            camino = "sesion"
+        elif lexico_concluyente(lexicos, cobertura):
+            # Coincidencia léxica clara: sin embedding ni búsqueda vectorial.
+            if reutilizable:
+                cacheada = cache_respuestas.buscar_texto(consulta)
+                CACHE_RESPUESTAS.incrementar("fallo" if cacheada is None else "acierto")
+                if cacheada is not None:
+                    log("Respuesta servida desde la caché semántica.", clave="texto")
+                    return cacheada
+            resultados = [(id_, documento, metadatos, None) for id_, documento, metadatos, _ in lexicos]
+            camino = "lexico"
+        else:
+            with medir("embedding"):
+                query_embedding = embedding_consulta(consulta)
+            if reutilizable:
+                faq = indice_preguntas.buscar_vector(query_embedding)
+                FAQ.incrementar("fallo" if faq is None else "acierto")
+                if faq is not None:
+                    log("Respuesta servida desde las preguntas frecuentes.")
+                    return faq[0], [faq[1]]
+                cacheada = cache_respuestas.buscar(query_embedding)
+                CACHE_RESPUESTAS.incrementar("fallo" if cacheada is None else "acierto")
+                if cacheada is not None:
+                    log("Respuesta servida desde la caché semántica.")
+                    return cacheada
+
+            with medir("recuperacion"):
+                vectoriales = recuperador().buscar(query_embedding, RECUPERACION_K)
+            resultados = fusionar_rrf(vectoriales, lexicos, RECUPERACION_K) if lexicos else vectoriales
+            camino = "hibrido" if lexicos else "vectorial"
+        RECUPERACIONES.incrementar(camino)
+        with medir("contexto"):
+            contexto, ids_contexto, tokens_contexto = construir_contexto(resultados)
     except Exception as e:
-        print(f"Error al buscar en ChromaDB: {e}")
-        return "Hubo un problema al consultar mi base de conocimiento."
+        log(f"Error al buscar en la base de conocimiento: {e}", nivel="error")
+        return "Hubo un problema al consultar mi base de conocimiento.", []
         
     # (El prompt y la lógica de respuesta no cambian)
     # ...
@@ -426,36 +1581,386 @@ def ask_candidato_ia(pregunta):
     Información de Apoyo:
     {contexto}
     ---
-    Pregunta del Ciudadano:
+    {_antecedentes_prompt(antecedentes)}Pregunta del Ciudadano:
     "{pregunta}"
     Respuesta de Javier Montoya:
     """
+    tokens_prompt = contar_tokens(prompt_template)
+    TOKENS.observar(tokens_prompt, "prompt")
+    log("Prompt armado.", tokens_prompt=tokens_prompt, tokens_contexto=tokens_contexto,
+        fragmentos_usados=len(ids_contexto), fragmentos_recuperados=len(resultados), camino=camino)
     try:
-        res_completion = openai.ChatCompletion.create(model="gpt-4", messages=[{"role": "user", "content": prompt_template}], temperature=0.4)
-        return res_completion['choices'][0]['message']['content']
+        with medir("completion"):
+            if entrega is not None and OPENAI_STREAMING:
+                stream = cliente_openai.llamar(openai.ChatCompletion.create, OPENAI_TIMEOUT_CHAT, model="gpt-4",
+                                               messages=[{"role": "user", "content": prompt_template}], temperature=0.4, stream=True)
+                for evento in stream:
+                    entrega.agregar(evento['choices'][0].get('delta', {}).get('content') or "")
+                respuesta = entrega.texto
+            else:
+                res_completion = cliente_openai.llamar(openai.ChatCompletion.create, OPENAI_TIMEOUT_CHAT, model="gpt-4",
+                                                       messages=[{"role": "user", "content": prompt_template}], temperature=0.4)
+                respuesta = res_completion['choices'][0]['message']['content']
+        TOKENS.observar(contar_tokens(respuesta), "completion")
+        if reutilizable:
+            cache_respuestas.guardar(query_embedding, respuesta, consulta, ids_contexto)
+        return respuesta, ids_contexto
     except Exception as e:
-        print(f"Error al generar la respuesta con OpenAI: {e}")
-        return "Tuve un inconveniente al formular la respuesta."
+        if entrega is not None and entrega.texto:
+            # El ciudadano ya recibió parte de la respuesta; se completa con lo recibido.
+            log(f"Error durante el streaming de la respuesta: {e}", nivel="error")
+            return entrega.texto, ids_contexto
+        log(f"Error al generar la respuesta con OpenAI: {e}", nivel="error")
+        return "Tuve un inconveniente al formular la respuesta.", ids_contexto
+
+
+# --- ENTREGA DIFERIDA POR LA API REST DE TWILIO ---
+# En modo asíncrono el webhook responde de inmediato con un TwiML vacío y la
+# respuesta se envía después, para no bloquear workers mientras GPT-4 responde.
+WHATSAPP_ASINCRONO = os.getenv("WHATSAPP_ASINCRONO", "0") == "1"
+COLA_HILOS = int(os.getenv("COLA_HILOS", "4"))
+COLA_CAPACIDAD = int(os.getenv("COLA_CAPACIDAD", "1000"))
+TWILIO_REINTENTOS = int(os.getenv("TWILIO_REINTENTOS", "3"))
+TWILIO_ESPERA_BASE = float(os.getenv("TWILIO_ESPERA_BASE", "1.0"))
+MENSAJE_SATURADO = "Estoy recibiendo muchos mensajes en este momento. Por favor, inténtalo de nuevo en unos minutos."
+
+class ClienteTwilioLocal:
+    """Sustituto sin red de twilio.rest.Client: guarda los mensajes enviados en memoria."""
+
+    def __init__(self):
+        self.enviados = []
+        self.messages = self  # imita client.messages.create(...)
+
+    def create(self, from_, to, body):
+        self.enviados.append({"from_": from_, "to": to, "body": body})
+        log("Mensaje enviado con el cliente local de Twilio.", origen=from_, destino=to, cuerpo=body)
+
+_cliente_twilio = None
+
+def cliente_twilio():
+    """Cliente REST de Twilio; sin credenciales (o con TWILIO_LOCAL=1) se usa el stub local."""
+    global _cliente_twilio
+    if _cliente_twilio is None:
+        sid, token = os.getenv("TWILIO_ACCOUNT_SID"), os.getenv("TWILIO_AUTH_TOKEN")
+        if sid and token and os.getenv("TWILIO_LOCAL", "0") != "1":
+            _cliente_twilio = TwilioClient(sid, token)
+        else:
+            _cliente_twilio = ClienteTwilioLocal()
+    return _cliente_twilio
+
+def enviar_whatsapp(origen, destino, texto):
+    """Envía un mensaje reintentando con espera exponencial si Twilio falla."""
+    for intento in range(1, TWILIO_REINTENTOS + 1):
+        try:
+            cliente_twilio().messages.create(from_=origen, to=destino, body=texto)
+            return True
+        except Exception as e:
+            log(f"Error al enviar el mensaje por Twilio (intento {intento}/{TWILIO_REINTENTOS}): {e}", nivel="error")
+            if intento < TWILIO_REINTENTOS:
+                time.sleep(TWILIO_ESPERA_BASE * 2 ** (intento - 1))
+    return False
+
+class ColaPorRemitente:
+    """Cola acotada con un pool de hilos que respeta el orden de cada remitente.
+
+    Los mensajes de un mismo remitente nunca se procesan en paralelo: el
+    remitente vuelve a la fila de listos solo cuando termina su mensaje actual.
+    Los hilos se arrancan de forma perezosa en el proceso que los usa, así que
+    la cola es segura frente al fork de gunicorn.
+    """
+
+    def __init__(self, procesar, hilos, capacidad):
+        self._procesar = procesar
+        self._num_hilos = hilos
+        self.capacidad = capacidad
+        self._cond = threading.Condition()
+        self._por_remitente = {}  # remitente -> deque de mensajes (el primero está en curso o listo)
+        self._listos = deque()
+        self._pendientes = 0
+        self._pid = None
+
+    @property
+    def profundidad(self):
+        return self._pendientes
+
+    def _arrancar(self):
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            for i in range(self._num_hilos):
+                threading.Thread(target=self._trabajar, name=f"cola-whatsapp-{i}", daemon=True).start()
+
+    def encolar(self, remitente, mensaje):
+        """Devuelve False si la cola está llena (contrapresión)."""
+        with self._cond:
+            self._arrancar()
+            if self._pendientes >= self.capacidad:
+                return False
+            cola = self._por_remitente.get(remitente)
+            if cola is None:
+                cola = self._por_remitente[remitente] = deque()
+                self._listos.append(remitente)
+                self._cond.notify()
+            cola.append(mensaje)
+            self._pendientes += 1
+            return True
+
+    def _trabajar(self):
+        while True:
+            with self._cond:
+                while not self._listos:
+                    self._cond.wait()
+                remitente = self._listos.popleft()
+                mensaje = self._por_remitente[remitente][0]
+            try:
+                self._procesar(mensaje)
+            except Exception as e:
+                log(f"Error al procesar el mensaje diferido de {remitente}: {e}", nivel="error")
+            with self._cond:
+                cola = self._por_remitente[remitente]
+                cola.popleft()
+                self._pendientes -= 1
+                if cola:
+                    self._listos.append(remitente)
+                    self._cond.notify()
+                else:
+                    del self._por_remitente[remitente]
+
+def procesar_mensaje_diferido(mensaje):
+    iniciar_peticion(mensaje['request_id'], mensaje['recibido'])
+    observar_desde_inicio("cola")
+    def entregar(texto):
+        enviar_whatsapp(mensaje['para'], mensaje['desde'], texto)
+    respuesta_ia = None
+    try:
+        with medir("total"):
+            respuesta_ia = ask_candidato_ia(mensaje['cuerpo'], entregar=entregar, remitente=mensaje['desde'])
+        log("Respuesta enviada.", destino=mensaje['desde'], respuesta=respuesta_ia, tiempos_ms=tiempos_peticion())
+    finally:
+        colapsador.terminar(mensaje['claves'], respuesta_ia)
+
+cola_whatsapp = ColaPorRemitente(procesar_mensaje_diferido, COLA_HILOS, COLA_CAPACIDAD)
+METRICAS.append(Indicador("candidato_cola_profundidad", "Mensajes en la cola de entrega diferida.",
+                          lambda: cola_whatsapp.profundidad))
+METRICAS.append(Indicador("candidato_openai_circuito_abierto", "1 si el cortacircuitos de OpenAI está abierto.",
+                          lambda: cliente_openai.circuito_abierto))
+
+# --- LÍMITE POR REMITENTE Y MENSAJES DUPLICADOS ---
+# Una cubeta de tokens por número de WhatsApp frena a quien envía en ráfaga, y
+# los mensajes idénticos en curso (reintentos de Twilio con el mismo
+# MessageSid, o el mismo texto repetido por el ciudadano) comparten un solo
+# cálculo en lugar de lanzar otra llamada a GPT-4.
+LIMITE_MENSAJES_POR_MINUTO = float(os.getenv("LIMITE_MENSAJES_POR_MINUTO", "6"))  # 0 desactiva el límite
+LIMITE_RAFAGA = int(os.getenv("LIMITE_RAFAGA", "5"))
+# Con una ruta, las cubetas viven en SQLite y las comparten todos los workers.
+LIMITE_SQLITE_PATH = os.getenv("LIMITE_SQLITE_PATH", "")
+LIMITE_REMITENTES_MAX = int(os.getenv("LIMITE_REMITENTES_MAX", "100000"))
+# Twilio corta el webhook a los 15 s: esperar más solo retiene un hilo del worker.
+COALESCER_ESPERA_MAX = float(os.getenv("COALESCER_ESPERA_MAX", "14"))
+MENSAJE_LIMITE = "Recibí varios mensajes tuyos muy seguidos. Dame un momento y vuelve a escribirme en un minuto."
+
+class LimitadorRemitentes:
+    """Cubeta de tokens por remitente: `rafaga` mensajes seguidos y luego `por_minuto`.
+
+    Sin `path` las cubetas están en memoria del worker (acotadas a
+    `max_remitentes`); con `path` se guardan en SQLite, con la conexión abierta
+    por proceso como en CacheEmbeddings.
+    """
+
+    def __init__(self, por_minuto, rafaga, path="", max_remitentes=LIMITE_REMITENTES_MAX):
+        self.por_segundo = por_minuto / 60
+        self.rafaga = rafaga
+        self.path = path
+        self.max_remitentes = max_remitentes
+        self._lock = threading.Lock()
+        self._cubetas = OrderedDict()  # remitente -> (tokens, última actualización), de la más vieja a la más nueva
+        self._conn = None
+        self._pid = None
+
+    @property
+    def _segundos_para_llenar(self):
+        return self.rafaga / self.por_segundo
+
+    def _consumir(self, cubeta, ahora):
+        """Recarga la cubeta y consume un token. Devuelve (permitido, tokens restantes)."""
+        tokens, actualizado = cubeta if cubeta else (self.rafaga, ahora)
+        tokens = min(self.rafaga, tokens + (ahora - actualizado) * self.por_segundo)
+        if tokens < 1:
+            return False, tokens
+        return True, tokens - 1
+
+    def _conexion(self):
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS cubetas ("
+                         "remitente TEXT PRIMARY KEY, tokens REAL NOT NULL, actualizado REAL NOT NULL)")
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def _purgar(self, ahora):
+        # Una cubeta que ya se habría llenado equivale a no tenerla; por encima del
+        # tope se expulsan las menos recientes aunque no estén llenas.
+        while self._cubetas:
+            _, actualizado = next(iter(self._cubetas.values()))
+            if ahora - actualizado < self._segundos_para_llenar and len(self._cubetas) <= self.max_remitentes:
+                break
+            self._cubetas.popitem(last=False)
+
+    def permitir(self, remitente):
+        if self.por_segundo <= 0:
+            return True
+        ahora = time.time()
+        with self._lock:
+            if not self.path:
+                permitido, tokens = self._consumir(self._cubetas.pop(remitente, None), ahora)
+                self._cubetas[remitente] = (tokens, ahora)
+                self._purgar(ahora)
+                return permitido
+            conn = self._conexion()
+            # BEGIN IMMEDIATE toma el bloqueo de escritura: leer y actualizar es atómico entre workers.
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                cubeta = conn.execute("SELECT tokens, actualizado FROM cubetas WHERE remitente = ?", (remitente,)).fetchone()
+                permitido, tokens = self._consumir(cubeta, ahora)
+                conn.execute("INSERT OR REPLACE INTO cubetas (remitente, tokens, actualizado) VALUES (?, ?, ?)",
+                             (remitente, tokens, ahora))
+                if random.random() < 0.01:
+                    conn.execute("DELETE FROM cubetas WHERE actualizado < ?", (ahora - self._segundos_para_llenar,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            return permitido
+
+class _PeticionEnCurso:
+
+    def __init__(self):
+        self.listo = threading.Event()
+        self.respuesta = None
+
+class ColapsadorPeticiones:
+    """Registro de mensajes en curso; los duplicados se unen al primero en vez de recalcular."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._en_curso = {}  # clave -> _PeticionEnCurso
+
+    @staticmethod
+    def claves(sid, remitente, cuerpo):
+        claves = [("sid", sid)] if sid else []
+        return claves + [("cuerpo", remitente, normalizar_texto(cuerpo).casefold())]
+
+    def unirse(self, claves):
+        """Devuelve (petición en curso, clave que coincidió); si no hay ninguna, registra
+        una nueva y la clave es None: quien llama la calcula y debe llamar a terminar()."""
+        with self._lock:
+            for clave in claves:
+                if clave in self._en_curso:
+                    return self._en_curso[clave], clave
+            peticion = _PeticionEnCurso()
+            for clave in claves:
+                self._en_curso[clave] = peticion
+            return peticion, None
+
+    def terminar(self, claves, respuesta):
+        with self._lock:
+            peticion = self._en_curso.get(claves[0])
+            for clave in claves:
+                self._en_curso.pop(clave, None)
+        if peticion is not None:
+            peticion.respuesta = respuesta
+            peticion.listo.set()
+
+limitador_remitentes = LimitadorRemitentes(LIMITE_MENSAJES_POR_MINUTO, LIMITE_RAFAGA, LIMITE_SQLITE_PATH)
+colapsador = ColapsadorPeticiones()
 
 
 @app.route("/whatsapp", methods=['POST'])
 def whatsapp_reply():
-    # --- MODIFICACIÓN CLAVE: Carga Perezosa ---
-    # Antes de procesar cualquier mensaje, nos aseguramos de que el cerebro esté cargado.
-    if not CEREBRO_CARGADO:
-        cargar_y_verificar_cerebro()
+    # Normalmente el cerebro ya se precargó al arrancar; esto solo cubre el caso
+    # de un servidor que no ejecutó el hook de arranque.
+    asegurar_cerebro()
 
+    sid = request.values.get('MessageSid')
+    iniciar_peticion(sid or request.headers.get('X-Request-ID'))
     incoming_msg = request.values.get('Body', '').strip()
-    print(f"Mensaje recibido: {incoming_msg}")
+    remitente = request.values.get('From', '')
+    log("Mensaje recibido.", remitente=remitente, cuerpo=incoming_msg)
     resp = MessagingResponse()
-    respuesta_ia = ask_candidato_ia(incoming_msg)
-    resp.message(respuesta_ia)
-    print(f"Respuesta enviada: {respuesta_ia}")
+
+    claves = ColapsadorPeticiones.claves(sid, remitente, incoming_msg)
+    en_curso, coincidencia = colapsador.unirse(claves)
+    if coincidencia is not None:
+        MENSAJES.incrementar("duplicado")
+        log("Mensaje duplicado; se une al que ya está en curso.", motivo=coincidencia[0])
+        # Un reintento de Twilio (mismo MessageSid) espera la respuesta del original,
+        # porque Twilio ya descartó esa conexión. El mismo texto repetido no recibe
+        # otra copia: la respuesta llega por el mensaje original.
+        if coincidencia[0] == "sid" and not WHATSAPP_ASINCRONO and en_curso.listo.wait(COALESCER_ESPERA_MAX):
+            for parte in dividir_mensaje(en_curso.respuesta or ""):
+                resp.message(parte)
+        return str(resp)
+
+    respuesta, diferido = None, False
+    try:
+        respuesta, diferido = _atender_whatsapp(resp, remitente, incoming_msg, claves)
+    finally:
+        if not diferido:
+            colapsador.terminar(claves, respuesta)
     return str(resp)
 
-# El bloque __main__ ya no es necesario para el despliegue con Gunicorn
-# if __name__ == "__main__":
-#     cargar_y_verificar_cerebro()
-#     port = int(os.environ.get("PORT", 5000))
-#     print(f"API iniciada en el puerto {port}")
-#     serve(app, host="0.0.0.0", port=port)
\ No newline at end of file
+def _atender_whatsapp(resp, remitente, incoming_msg, claves):
+    """Llena el TwiML de `resp`. Devuelve (respuesta, diferido); si el mensaje quedó
+    en la cola, es el hilo de la cola quien libera sus claves del colapsador."""
+    if not limitador_remitentes.permitir(remitente):
+        MENSAJES.incrementar("limitado")
+        log("Límite de mensajes por remitente superado.", nivel="warning", remitente=remitente)
+        resp.message(MENSAJE_LIMITE)
+        return None, False
+    # Un seguimiento ("¿y eso cuánto cuesta?") nunca es una pregunta frecuente por sí solo.
+    seguimiento = es_seguimiento(incoming_msg) and bool(sesiones.turnos(remitente))
+    faq = None if seguimiento else responder_faq(incoming_msg)
+    if faq is not None:
+        respuesta_faq, id_faq = faq
+        sesiones.registrar(remitente, incoming_msg, [id_faq])
+        # Pregunta frecuente: se responde en el mismo TwiML, también en modo asíncrono.
+        for parte in dividir_mensaje(respuesta_faq):
+            resp.message(parte)
+        log("Respuesta enviada.", respuesta=respuesta_faq, faq=True, tiempos_ms=tiempos_peticion())
+        return respuesta_faq, False
+    if WHATSAPP_ASINCRONO:
+        mensaje = {'desde': remitente, 'para': request.values.get('To', ''), 'cuerpo': incoming_msg,
+                   'request_id': _request_id.get(), 'recibido': _inicio_peticion.get(), 'claves': claves}
+        if not cola_whatsapp.encolar(mensaje['desde'], mensaje):
+            MENSAJES.incrementar("rechazado")
+            log("Cola llena; mensaje rechazado.", nivel="warning", profundidad=cola_whatsapp.profundidad)
+            resp.message(MENSAJE_SATURADO)
+            return None, False
+        MENSAJES.incrementar("asincrono")
+        return None, True
+    MENSAJES.incrementar("sincrono")
+    with medir("total"):
+        respuesta_ia = ask_candidato_ia(incoming_msg, remitente=remitente)
+    for parte in dividir_mensaje(respuesta_ia):
+        resp.message(parte)
+    log("Respuesta enviada.", respuesta=respuesta_ia, tiempos_ms=tiempos_peticion())
+    return respuesta_ia, False
+
+@app.route("/ready", methods=['GET'])
+def ready():
+    """Readiness: 200 solo cuando el índice está cargado en este worker."""
+    if not cerebro_listo():
+        return jsonify(listo=False), 503
+    return jsonify(listo=True, version=VERSION_DOCUMENTO)
+
+@app.route("/metrics", methods=['GET'])
+def metrics():
+    cuerpo = "\n".join(metrica.exponer() for metrica in METRICAS) + "\n"
+    return Response(cuerpo, mimetype="text/plain; version=0.0.4")
+
+# Con gunicorn la precarga la hacen los hooks de gunicorn.conf.py.
+if __name__ == "__main__":
+    asegurar_cerebro()
+    port = int(os.environ.get("PORT", 5000))
+    log(f"API iniciada en el puerto {port}")
+    serve(app, host="0.0.0.0", port=port, threads=int(os.environ.get("WAITRESS_THREADS", 8)))
@@ -0,0 +1,474 @@
+# ==============================================================================
+# FELIX AI SOLUTIONS - BENCHMARK DEL PIPELINE /whatsapp
+# Prueba de carga sin red: un servidor OpenAI falso (con latencias configurables)
+# responde embeddings y completions, el índice vive en un directorio temporal y
+# los mensajes imitan los formularios que envía Twilio.
+#
+# Uso:
+#   python benchmark.py --modos inproceso,waitress,gunicorn --concurrencia 1,8,32
+#
+# Reporta throughput y p50/p95/p99 por etapa (a partir de los logs JSON de la
+# API), la latencia vista por el cliente, las tasas de acierto de las cachés y
+# las llamadas que llegaron a OpenAI, para cada modo y nivel de concurrencia.
+# Cada corrida arranca en frío (cachés y sesiones nuevas) y reproduce la misma
+# carga, así que las corridas son comparables entre sí.
+# ==============================================================================
+
+import argparse
+import base64
+import itertools
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREGUNTAS = [
+    "¿Cuál es su propuesta de seguridad?",
+    "¿cuál es su propuesta de seguridad?",
+    "¿Qué va a hacer con la minería en Salento y el Valle de Cocora?",
+    "¿Cómo va a generar empleo para los jóvenes?",
+    "¿De dónde saldrá el dinero para financiar sus propuestas?",
+    "¿Qué experiencia tiene en el sector público?",
+    "¿Cómo piensa apoyar a los cafeteros?",
+    "¿Qué hará por los municipios que no son Salento ni Filandia?",
+    "¿Cómo va a mejorar la salud en las zonas rurales?",
+    "¿Cómo luchará contra la corrupción?",
+    "¿Qué propone para la extorsión a los comerciantes?",
+    "¿Qué hará por las mujeres víctimas de violencia?",
+    "¿Qué es el Quindío Tech Hub?",
+    "¿Cómo va a apoyar a las PyMEs?",
+    "¿Qué hará por la educación pública?",
+    "¿Qué propone para la cultura y las artes?",
+    "¿Qué hará por los deportistas?",
+    "¿Cómo va a mejorar las citas médicas?",
+    "¿Qué hará con la salud mental?",
+    "¿Cómo va a arreglar las vías terciarias?",
+    "¿Qué propone para el reciclaje?",
+    "¿Cómo va a proteger los ríos?",
+    "¿Qué hará con el tráfico en Armenia?",
+    "¿Qué propone para los animales domésticos?",
+    "¿Cuál es su visión para el aeropuerto El Edén?",
+    "¿Qué hará por los adultos mayores?",
+    "¿Cómo se financia su campaña?",
+    "¿Qué dicen de usted en Génova?",
+    "¿Cuándo es el encuentro en Salento?",
+    "¿y cuánto cuesta eso?",
+]
+
+RESPUESTA_FALSA = (
+    "Mi propuesta es clara y está pensada para el Quindío. Vamos a trabajar de la mano con las comunidades. "
+    "Destinaremos recursos específicos y publicaremos cada avance para que la ciudadanía pueda hacer seguimiento. "
+    "Creo firmemente que con participación y transparencia lograremos resultados concretos en los primeros meses."
+)
+
+DIMENSION_EMBEDDING = 1536
+
+
+# --- SERVIDOR OPENAI FALSO ---
+
+def vector_falso(texto):
+    """Bolsa de palabras con hashing: textos parecidos dan vectores parecidos."""
+    vector = [0.0] * DIMENSION_EMBEDDING
+    for palabra in texto.lower().split():
+        vector[zlib.crc32(palabra.strip("¿?¡!.,;:").encode("utf-8")) % DIMENSION_EMBEDDING] += 1.0
+    norma = sum(v * v for v in vector) ** 0.5 or 1.0
+    return [v / norma for v in vector]
+
+class ManejadorOpenAIFalso(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, como la API real
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, datos):
+        cuerpo = json.dumps(datos).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def _contar(self, clave, cantidad=1):
+        with self.server.lock_llamadas:
+            self.server.llamadas[clave] += cantidad
+
+    def do_POST(self):
+        longitud = int(self.headers.get("Content-Length", 0))
+        peticion = json.loads(self.rfile.read(longitud) or b"{}")
+        if self.path.endswith("/embeddings"):
+            self._contar("embeddings")
+            self._contar("textos_embebidos", len(peticion["input"]) if isinstance(peticion["input"], list) else 1)
+            self._embeddings(peticion)
+        elif self.path.endswith("/chat/completions"):
+            self._contar("completions")
+            self._chat(peticion)
+        else:
+            self.send_error(404)
+
+    def _embeddings(self, peticion):
+        time.sleep(self.server.latencia_embedding)
+        textos = peticion["input"] if isinstance(peticion["input"], list) else [peticion["input"]]
+        datos = []
+        for i, texto in enumerate(textos):
+            vector = vector_falso(texto)
+            if peticion.get("encoding_format") == "base64":
+                vector = base64.b64encode(array("f", vector).tobytes()).decode("ascii")
+            datos.append({"object": "embedding", "index": i, "embedding": vector})
+        self._json({"object": "list", "data": datos, "model": peticion.get("model", "text-embedding-ada-002"),
+                    "usage": {"prompt_tokens": 0, "total_tokens": 0}})
+
+    def _chat(self, peticion):
+        time.sleep(self.server.latencia_completion)  # tiempo hasta el primer token
+        palabras = RESPUESTA_FALSA.split(" ")
+        por_palabra = 1.0 / self.server.tokens_por_segundo
+        id_completion = f"chatcmpl-{uuid.uuid4().hex}"
+        if not peticion.get("stream"):
+            time.sleep(len(palabras) * por_palabra)
+            self._json({"id": id_completion, "object": "chat.completion", "model": peticion.get("model"),
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": RESPUESTA_FALSA}}],
+                        "usage": {"prompt_tokens": 0, "completion_tokens": len(palabras), "total_tokens": 0}})
+            return
+        # Server-sent events; sin Content-Length, así que se cierra la conexión al terminar.
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        for i, palabra in enumerate(palabras):
+            evento = {"id": id_completion, "object": "chat.completion.chunk", "model": peticion.get("model"),
+                      "choices": [{"index": 0, "finish_reason": None,
+                                   "delta": {"content": palabra if i == 0 else " " + palabra}}]}
+            self.wfile.write(f"data: {json.dumps(evento)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(por_palabra)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+def iniciar_openai_falso(latencia_embedding, latencia_completion, tokens_por_segundo):
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), ManejadorOpenAIFalso)
+    servidor.daemon_threads = True
+    servidor.latencia_embedding = latencia_embedding
+    servidor.latencia_completion = latencia_completion
+    servidor.tokens_por_segundo = tokens_por_segundo
+    servidor.lock_llamadas = threading.Lock()
+    reiniciar_llamadas(servidor)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_address[1]}/v1"
+
+def reiniciar_llamadas(servidor):
+    """Pone en cero los contadores de llamadas recibidas y devuelve los anteriores."""
+    with servidor.lock_llamadas:
+        anteriores = getattr(servidor, "llamadas", None)
+        servidor.llamadas = {"embeddings": 0, "textos_embebidos": 0, "completions": 0}
+    return anteriores
+
+
+# --- RECOLECCIÓN DE RESULTADOS ---
+
+class Registro:
+    """Acumula los logs "Respuesta enviada." de la API y las latencias del cliente."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.tiempos = []
+        self.cliente = []
+        self.errores = 0
+        self.duplicados = 0  # mensajes unidos a uno idéntico en curso: no generan respuesta propia
+        self.aciertos_cache_respuestas = 0
+        self.aciertos_faq = 0
+
+    def linea_log(self, linea):
+        try:
+            registro = json.loads(linea)
+        except ValueError:
+            return
+        if registro.get("mensaje") == "Respuesta enviada.":
+            with self._lock:
+                self.tiempos.append(registro.get("tiempos_ms", {}))
+                self.aciertos_faq += bool(registro.get("faq"))
+        elif registro.get("mensaje") == "Respuesta servida desde la caché semántica.":
+            with self._lock:
+                self.aciertos_cache_respuestas += 1
+        elif registro.get("mensaje") == "Respuesta servida desde las preguntas frecuentes.":
+            with self._lock:
+                self.aciertos_faq += 1
+        elif registro.get("mensaje", "").startswith("Mensaje duplicado"):
+            with self._lock:
+                self.duplicados += 1
+
+    def respuestas(self):
+        with self._lock:
+            return len(self.tiempos) + self.duplicados
+
+def percentil(valores, p):
+    """Percentil por rango más cercano."""
+    ordenados = sorted(valores)
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)]
+
+def reportar(modo, concurrencia, peticiones, duracion, registro, llamadas):
+    print(f"\nmodo={modo} concurrencia={concurrencia} peticiones={peticiones} "
+          f"duración={duracion:.2f}s throughput={peticiones / duracion:.1f} msg/s errores={registro.errores} "
+          f"duplicados={registro.duplicados}")
+    etapas = {"cliente": registro.cliente}
+    for tiempos in registro.tiempos:
+        for etapa, ms in tiempos.items():
+            etapas.setdefault(etapa, []).append(ms)
+    print(f"  {'etapa':<16}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for etapa, valores in etapas.items():
+        if valores:
+            print(f"  {etapa:<16}{len(valores):>6}{percentil(valores, 50):>10.1f}"
+                  f"{percentil(valores, 95):>10.1f}{percentil(valores, 99):>10.1f}")
+    # Los textos embebidos por OpenAI son las preguntas que no acertaron en la caché de embeddings.
+    print(f"  cachés: respuestas={registro.aciertos_cache_respuestas / peticiones:.0%} "
+          f"faq={registro.aciertos_faq / peticiones:.0%} | OpenAI: "
+          f"{llamadas['textos_embebidos']} textos embebidos ({llamadas['textos_embebidos'] / peticiones:.2f}/msg) "
+          f"en {llamadas['embeddings']} llamadas, {llamadas['completions']} completions "
+          f"({llamadas['completions'] / peticiones:.2f}/msg)")
+    # Las etapas y los aciertos salen de los logs: si faltan líneas, las cifras son parciales.
+    atendidas = peticiones - registro.errores
+    if registro.respuestas() != atendidas:
+        print(f"  AVISO: los logs registran {registro.respuestas()} respuestas de {atendidas} peticiones "
+              f"atendidas; las etapas y los aciertos de arriba son parciales.")
+
+
+# --- GENERACIÓN DE CARGA ---
+
+def formulario_twilio(pregunta, remitente):
+    sid = "SM" + uuid.uuid4().hex
+    return {
+        "SmsMessageSid": sid, "NumMedia": "0", "ProfileName": "Ciudadano", "SmsSid": sid,
+        "WaId": remitente, "SmsStatus": "received", "Body": pregunta,
+        "To": "whatsapp:+14155238886", "NumSegments": "1", "ReferralNumMedia": "0",
+        "MessageSid": sid, "AccountSid": "AC" + "0" * 32, "From": f"whatsapp:+{remitente}",
+        "ApiVersion": "2010-04-01",
+    }
+
+def generar_carga(preguntas, peticiones, remitentes, semilla=7):
+    aleatorio = random.Random(semilla)
+    return [formulario_twilio(aleatorio.choice(preguntas), f"57300{aleatorio.randrange(remitentes):07d}")
+            for _ in range(peticiones)]
+
+def ejecutar(enviar, carga, concurrencia, registro, asincrono, espera_max=300):
+    def una(formulario):
+        inicio = time.perf_counter()
+        try:
+            enviar(formulario)
+        except Exception as e:
+            with registro._lock:
+                registro.errores += 1
+            print(f"Error en la petición: {e}", file=sys.stderr)
+        with registro._lock:
+            registro.cliente.append((time.perf_counter() - inicio) * 1000)
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        list(pool.map(una, carga))
+    if asincrono:
+        # En modo asíncrono la respuesta sale después del ack; esperamos a que se entreguen todas.
+        limite = time.monotonic() + espera_max
+        while registro.respuestas() < len(carga) - registro.errores and time.monotonic() < limite:
+            time.sleep(0.05)
+    return time.perf_counter() - inicio
+
+
+# --- MODOS DE SERVIDOR ---
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def cliente_http(url):
+    import requests
+    local = threading.local()
+
+    def enviar(formulario):
+        if not hasattr(local, "sesion"):
+            local.sesion = requests.Session()
+        local.sesion.post(url, data=formulario, timeout=120).raise_for_status()
+    return enviar
+
+def esperar_listo(url, proceso=None, espera_max=120):
+    import requests
+    limite = time.monotonic() + espera_max
+    while time.monotonic() < limite:
+        if proceso is not None and proceso.poll() is not None:
+            raise RuntimeError("El servidor terminó antes de estar listo.")
+        try:
+            if requests.get(url, timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"El servidor no quedó listo en {espera_max}s.")
+
+def reiniciar_estado(api, directorio_corrida):
+    """Cachés, sesiones y registros de duplicados nuevos: cada corrida en proceso arranca en frío."""
+    api.cache_embeddings = api.CacheEmbeddings(os.path.join(directorio_corrida, "embedding_cache.sqlite3"),
+                                               api.EMBEDDING_CACHE_MAX)
+    api.cache_respuestas = api.CacheRespuestas(api.ANSWER_CACHE_MAX, api.ANSWER_CACHE_SIMILITUD, api.ANSWER_CACHE_TTL)
+    api.cache_respuestas.invalidar(api.VERSION_DOCUMENTO)
+    api.sesiones = api.SesionesConversacion(api.SESION_TURNOS, api.SESION_TTL, api.SESIONES_MAX)
+    api.colapsador = api.ColapsadorPeticiones()
+    api.limitador_remitentes = api.LimitadorRemitentes(api.LIMITE_MENSAJES_POR_MINUTO, api.LIMITE_RAFAGA,
+                                                       api.LIMITE_SQLITE_PATH)
+
+def cerrar_waitress(servidor, hilo_servidor):
+    """Cierra el servidor desde su propio bucle: cerrar los sockets desde otro hilo
+    deja al bucle esperando sobre descriptores cerrados (OSError: [Errno 9])."""
+    from waitress import wasyncore
+
+    def cerrar():
+        servidor.task_dispatcher.shutdown()
+        wasyncore.close_all(servidor._map)
+    servidor.trigger.pull_trigger(cerrar)
+    hilo_servidor.join(timeout=30)
+
+def correr_en_proceso(api, modo, carga, concurrencia, asincrono, openai_falso, directorio_corrida):
+    reiniciar_estado(api, directorio_corrida)
+    reiniciar_llamadas(openai_falso)
+    registro = Registro()
+    log_original = api.log
+
+    def log_capturado(mensaje, nivel="info", **campos):
+        if mensaje in ("Respuesta enviada.", "Respuesta servida desde la caché semántica.",
+                       "Respuesta servida desde las preguntas frecuentes.") \
+                or mensaje.startswith("Mensaje duplicado"):
+            registro.linea_log(json.dumps({"mensaje": mensaje, **campos}, default=str))
+        elif nivel != "info":
+            log_original(mensaje, nivel, **campos)
+
+    api.log = log_capturado
+    try:
+        if modo == "inproceso":
+            def enviar(formulario):
+                respuesta = api.app.test_client().post("/whatsapp", data=formulario)
+                if respuesta.status_code != 200:
+                    raise RuntimeError(f"HTTP {respuesta.status_code}")
+            duracion = ejecutar(enviar, carga, concurrencia, registro, asincrono)
+        else:
+            from waitress import create_server
+            servidor = create_server(api.app, host="127.0.0.1", port=0, threads=concurrencia)
+            hilo_servidor = threading.Thread(target=servidor.run, daemon=True)
+            hilo_servidor.start()
+            try:
+                duracion = ejecutar(cliente_http(f"http://127.0.0.1:{servidor.effective_port}/whatsapp"),
+                                    carga, concurrencia, registro, asincrono)
+            finally:
+                cerrar_waitress(servidor, hilo_servidor)
+    finally:
+        api.log = log_original
+    reportar(modo, concurrencia, len(carga), duracion, registro, reiniciar_llamadas(openai_falso))
+
+def correr_gunicorn(carga, concurrencia, asincrono, workers, entorno, openai_falso, directorio_corrida):
+    # Proceso nuevo por corrida; la caché de embeddings (en disco) también es nueva.
+    entorno = dict(entorno, EMBEDDING_CACHE_PATH=os.path.join(directorio_corrida, "embedding_cache.sqlite3"))
+    registro = Registro()
+    puerto = puerto_libre()
+    hilos = max(1, concurrencia // workers)
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "api:app", "-b", f"127.0.0.1:{puerto}",
+         "-w", str(workers), "--threads", str(hilos)],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=entorno,
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, encoding="utf-8",
+    )
+
+    def leer_logs():
+        for linea in proceso.stdout:
+            registro.linea_log(linea)
+    hilo_logs = threading.Thread(target=leer_logs, daemon=True)
+    hilo_logs.start()
+    try:
+        esperar_listo(f"http://127.0.0.1:{puerto}/ready", proceso)
+        reiniciar_llamadas(openai_falso)
+        duracion = ejecutar(cliente_http(f"http://127.0.0.1:{puerto}/whatsapp"), carga, concurrencia, registro, asincrono)
+    finally:
+        proceso.terminate()
+        proceso.wait(timeout=30)
+        hilo_logs.join(timeout=10)  # lo que quedó en la tubería al terminar
+    reportar(f"gunicorn(w={workers},t={hilos})", concurrencia, len(carga), duracion, registro,
+             reiniciar_llamadas(openai_falso))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline del pipeline /whatsapp.")
+    parser.add_argument("--modos", default="inproceso,waitress", help="inproceso, waitress y/o gunicorn, separados por comas.")
+    parser.add_argument("--concurrencia", default="1,8,32", help="Niveles de concurrencia, separados por comas.")
+    parser.add_argument("--peticiones", type=int, default=200, help="Peticiones por corrida.")
+    parser.add_argument("--remitentes", type=int, default=50, help="Número de remitentes distintos.")
+    parser.add_argument("--workers", type=int, default=2, help="Workers de gunicorn.")
+    parser.add_argument("--preguntas", help="Archivo con una pregunta por línea (por defecto, un corpus incluido).")
+    parser.add_argument("--latencia-embedding-ms", type=float, default=80)
+    parser.add_argument("--latencia-completion-ms", type=float, default=600, help="Tiempo hasta el primer token.")
+    parser.add_argument("--tokens-por-segundo", type=float, default=40)
+    parser.add_argument("--recuperador", default="numpy", help="Backend de búsqueda (numpy o chroma).")
+    parser.add_argument("--asincrono", action="store_true", help="Mide el modo de entrega diferida.")
+    parser.add_argument("--sin-cache-respuestas", action="store_true", help="Desactiva la caché semántica de respuestas.")
+    args = parser.parse_args()
+
+    preguntas = PREGUNTAS
+    if args.preguntas:
+        with open(args.preguntas, encoding="utf-8") as f:
+            preguntas = [l.strip() for l in f if l.strip()]
+
+    openai_falso, url_openai = iniciar_openai_falso(args.latencia_embedding_ms / 1000, args.latencia_completion_ms / 1000,
+                                         args.tokens_por_segundo)
+    directorio = tempfile.mkdtemp(prefix="bench_candidato_")
+    entorno = dict(os.environ)
+    for variable in ("TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN"):
+        entorno.pop(variable, None)  # las respuestas diferidas van al cliente local de Twilio
+    entorno.update({
+        "OPENAI_API_KEY": "sk-benchmark",
+        "OPENAI_API_BASE": url_openai,
+        "CHROMA_PATH": os.path.join(directorio, "chroma_db"),
+        "INDICE_NUMPY_PATH": os.path.join(directorio, "indice_numpy"),
+        "EMBEDDING_CACHE_PATH": os.path.join(directorio, "embedding_cache.sqlite3"),
+        "RECUPERADOR": args.recuperador,
+        "INDEXAR_AL_INICIAR": "1",  # el índice temporal se construye en la primera corrida
+        "WHATSAPP_ASINCRONO": "1" if args.asincrono else "0",
+    })
+    # El límite por remitente frenaría la carga sintética; se activa exportándolo.
+    entorno.setdefault("LIMITE_MENSAJES_POR_MINUTO", "0")
+    if args.sin_cache_respuestas:
+        entorno["ANSWER_CACHE_MAX"] = "0"
+    os.environ.clear()
+    os.environ.update(entorno)
+
+    carga = generar_carga(preguntas, args.peticiones, args.remitentes)
+    niveles = [int(c) for c in args.concurrencia.split(",")]
+    corridas = itertools.count(1)
+
+    def directorio_corrida():
+        ruta = os.path.join(directorio, f"corrida_{next(corridas)}")
+        os.makedirs(ruta)
+        return ruta
+    try:
+        for modo in args.modos.split(","):
+            if modo == "gunicorn":
+                for concurrencia in niveles:
+                    correr_gunicorn(carga, concurrencia, args.asincrono, args.workers, entorno, openai_falso,
+                                    directorio_corrida())
+            else:
+                import api
+                api.asegurar_cerebro()
+                for concurrencia in niveles:
+                    correr_en_proceso(api, modo, carga, concurrencia, args.asincrono, openai_falso,
+                                      directorio_corrida())
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
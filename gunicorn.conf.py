@@ -0,0 +1,20 @@
+# ==============================================================================
+# Configuración de gunicorn (se carga sola al ejecutar `gunicorn api:app`)
+# El cerebro se indexa una vez en el proceso maestro, antes de crear los workers,
+# y cada worker abre su propio cliente de Chroma antes de aceptar mensajes.
+# ==============================================================================
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+
+def on_starting(server):
+    import api
+    api.asegurar_cerebro()
+
+def post_worker_init(worker):
+    import api
+    api.asegurar_cerebro()